@@ -0,0 +1,277 @@
+import asm8
+import chip8
+import debug8
+import headless8
+import argparse
+import hashlib
+import sys
+from collections import OrderedDict
+
+CACHE_SIZE = 16
+# programs whose analyses are kept, dropping the least recently used
+
+
+class Analysis:
+    """what a static pass over a program found: the instructions reachable
+    from its start and how control moves between them, what it can draw as
+    sprites or write over, and anything that stops it. Values of I are
+    followed as ranges, so an ADD I, vX widens the range by what a
+    register can hold. Where a JP V0 goes depends on v0, so its targets
+    aren't followed."""
+
+    def __init__(self, digest):
+        self.digest = digest
+        # sha256 of the program, the key the analysis is cached under
+        self.code = set()
+        # addresses of the instructions that can run
+        self.edges = {}
+        # addresses that can run next after each instruction, exit and bad
+        # instruction, by address
+        self.blocks = {}
+        # the control flow graph, as (end address, addresses that can run
+        # next) for each run of instructions entered only at its start and
+        # left only at its end, by start address
+        self.dynamic = {}
+        # first and last address each JP V0 can jump to, by its address
+        self.exits = set()
+        # addresses of exits that can be reached
+        self.bad = {}
+        # instructions that can be reached but don't decode, which
+        # Chip.execute raises on, by address
+        self.sprites = set()
+        # addresses DRW can read sprite rows from
+        self.writes = set()
+        # addresses LD B, vX and LD [I], vX can write to
+        self.modified = set()
+        # addresses of instructions that can be written over
+
+    def data(self, start, end):
+        """return the addresses between start and end that aren't part of
+        an instruction that can be reached"""
+        used = set()
+        for addr in self.code | self.exits | set(self.bad):
+            used.update((addr, addr + 1))
+        return [addr for addr in range(start, end) if addr not in used]
+
+
+def add_regI(regI):
+    """return a range of values of I after adding a register to it"""
+    lo, hi = regI
+    if hi + 0xFF > 0xFFF:
+        return (0, 0xFFF)
+    return (lo, hi + 0xFF)
+
+
+def build_blocks(analysis, start):
+    """split the instructions that can be reached into the runs of the
+    control flow graph"""
+    edges = analysis.edges
+    preds = {}
+    for addr, targets in edges.items():
+        for target in targets:
+            preds.setdefault(target, set()).add(addr)
+
+    leaders = {start}
+    for addr in edges:
+        # a block carries on only from an instruction that can't go
+        # anywhere else, and that nothing else goes to
+        if preds.get(addr) != {addr - 2} or edges[addr - 2] != (addr,):
+            leaders.add(addr)
+
+    for leader in leaders:
+        addr = leader
+        while edges[addr] == (addr + 2,) and addr + 2 not in leaders:
+            addr += 2
+        analysis.blocks[leader] = (addr + 2, edges[addr])
+
+
+def analyze(data, start=chip8.Chip.PROGRAM_MEM_INDEX):
+    """follow every path through a program loaded at start, as find_code
+    in debug8 does, and return an Analysis of it. A RET can go back to
+    after any CALL, and I starts at 0 as it does on a new chip"""
+    chip = chip8.Chip()
+    chip.load_mem(start, data)
+    mem = chip.mem
+    table = chip.decodeTable
+    analysis = Analysis(hashlib.sha256(bytes(data)).hexdigest())
+    edges = analysis.edges
+    digits = chip8.Chip.DIGIT_MEM_INDEX
+    end = chip8.Chip.RAM_SIZE
+
+    regI = {start: (0, 0)}
+    # range of values I can hold before each instruction
+    returns, rets = set(), set()
+    # addresses after each CALL, and of each RET, reached so far
+    todo = [start]
+
+    def follow(addr, value):
+        """widen the range of I at an address and look at it again if it
+        changed"""
+        old = regI.get(addr)
+        if old is not None:
+            value = (min(old[0], value[0]), max(old[1], value[1]))
+        if value != old:
+            regI[addr] = value
+            todo.append(addr)
+
+    while todo:
+        addr = todo.pop()
+        lo, hi = value = regI[addr]
+
+        inst = None
+        if addr + 1 < end:
+            inst = (mem[addr] << 8) + mem[addr + 1]
+        if inst == chip8.Chip.EXIT:
+            analysis.exits.add(addr)
+            edges[addr] = ()
+            continue
+        op = None if inst is None else table[inst]
+        if op is None:
+            analysis.bad[addr] = inst
+            edges[addr] = ()
+            continue
+        analysis.code.add(addr)
+
+        _, operands, name, _ = op
+        if name == "LDI":
+            value = (operands[0], operands[0])
+        elif name == "ADDi":
+            value = add_regI(value)
+        elif name == "LDdigit":
+            value = (digits, digits + 5 * 0xFF)
+        elif name == "DRW":
+            analysis.sprites.update(range(lo, min(hi + operands[2], end)))
+        elif name == "LDbcd":
+            analysis.writes.update(range(lo, min(hi + 3, end)))
+        elif name == "LDmemreg":
+            analysis.writes.update(range(lo, min(hi + operands[0] + 1, end)))
+
+        if name == "JP":
+            targets = (operands[0],)
+        elif name == "CALL":
+            targets = (operands[0],)
+            if addr + 2 not in returns:
+                returns.add(addr + 2)
+                for ret in rets:
+                    follow(addr + 2, regI[ret])
+        elif name == "RET":
+            targets = tuple(returns)
+            rets.add(addr)
+        elif name == "JP0":
+            targets = ()
+            analysis.dynamic[addr] = (operands[0], operands[0] + 0xFF)
+        elif name in debug8.SKIPS:
+            targets = (addr + 2, addr + 4)
+        else:
+            targets = (addr + 2,)
+
+        edges[addr] = targets
+        for target in targets:
+            follow(target, value)
+
+    # returns found after a RET was looked at go there too
+    for ret in rets:
+        edges[ret] = tuple(sorted(returns))
+
+    for addr in analysis.code:
+        if addr in analysis.writes or addr + 1 in analysis.writes:
+            analysis.modified.add(addr)
+    build_blocks(analysis, start)
+    return analysis
+
+
+_analyses = OrderedDict()
+# analyses of the programs seen most recently by their hash, oldest first
+
+
+def analyze_program(program):
+    """return the Analysis of a program loaded at Chip.PROGRAM_MEM_INDEX,
+    reusing the one for a recent program with the same hash"""
+    program = bytes(program).rstrip(b"\0")
+    digest = hashlib.sha256(program).hexdigest()
+    analysis = _analyses.pop(digest, None)
+    if analysis is None:
+        analysis = analyze(program)
+
+    _analyses[digest] = analysis
+    while len(_analyses) > CACHE_SIZE:
+        _analyses.popitem(last=False)
+    return analysis
+
+
+def analyze_chip(chip):
+    """return the Analysis of the program loaded on a chip, which has to
+    be done before the program runs and writes over anything"""
+    return analyze_program(chip.mem[chip8.Chip.PROGRAM_MEM_INDEX :])
+
+
+def spans(addresses):
+    """return a collection of addresses as sorted [first, last] runs"""
+    runs = []
+    for addr in sorted(addresses):
+        if runs and runs[-1][1] == addr - 1:
+            runs[-1][1] = addr
+        else:
+            runs.append([addr, addr])
+    return runs
+
+
+def analysis_result(analysis, length):
+    """return an analysis of a program length bytes long as a dict that
+    can be written as JSON"""
+    start = chip8.Chip.PROGRAM_MEM_INDEX
+    return {
+        "sha256": analysis.digest,
+        "instructions": len(analysis.code),
+        "blocks": [
+            [addr, end, list(targets)]
+            for addr, (end, targets) in sorted(analysis.blocks.items())
+        ],
+        "dynamic": [
+            [addr, first, last]
+            for addr, (first, last) in sorted(analysis.dynamic.items())
+        ],
+        "exits": sorted(analysis.exits),
+        "bad": [[addr, inst] for addr, inst in sorted(analysis.bad.items())],
+        "data": spans(analysis.data(start, start + length)),
+        "sprites": spans(analysis.sprites),
+        "writes": spans(analysis.writes),
+        "modified": sorted(analysis.modified),
+    }
+
+
+def init_argparse():
+    """create an argument parser"""
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [OPTION] FILE",
+        description="""Analyze a chip8 program without running it and print its
+            control flow graph, data and anything that stops it as JSON.""",
+    )
+    parser.add_argument("rom", metavar="FILE", help="the program to analyze")
+    parser.add_argument(
+        "-o", "--output", metavar="file", help="write the result to a file instead of stdout"
+    )
+    return parser
+
+
+def main():
+    parser = init_argparse()
+    args = parser.parse_args()
+
+    if args.rom.lower().endswith(".asm"):
+        try:
+            program = asm8.assemble_file(args.rom)
+        except ValueError as e:
+            parser.error(f"{args.rom}: {e}")
+    else:
+        with open(args.rom, "rb") as rom:
+            program = rom.read()
+
+    result = analysis_result(analyze_program(program), len(program))
+    headless8.write_result(result, args.output)
+    if result["bad"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import chip8
+import debug8
+import argparse
+import hashlib
+import os
+import re
+import string
+
+VERSION = 1
+# part of every cache key, bumped whenever the same source would assemble
+# differently
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(os.path.join("~", ".cache")),
+    "emu8",
+    "asm",
+)
+# where assembled programs are kept by the hash of their source
+
+NUMBER = r"(0x[0-9a-f]+|[0-9]+)"
+# an operand written in hex with 0x or in decimal
+
+# where each operand goes in an instruction
+SHIFTS = {"x": 8, "y": 4, "kk": 0, "nnn": 0, "n": 0}
+
+# the most each operand can hold
+LIMITS = {"x": 0xF, "y": 0xF, "kk": 0xFF, "nnn": 0xFFF, "n": 0xF}
+
+
+def parse_number(text):
+    """return the value of a number matched by NUMBER, which is decimal
+    unless it starts with 0x, even with leading zeros"""
+    if text.lower().startswith("0x"):
+        return int(text, 16)
+    return int(text, 10)
+
+
+def operand_regex(name):
+    """return the regex matching the text debug8.format_operands writes for
+    an operand"""
+    if name in ("x", "y"):
+        return "([0-9a-f])"
+    return NUMBER
+
+
+def build_encoders():
+    """return the encoders for every handler in chip8.OPCODES by mnemonic,
+    each as (regex matching the instruction's text, pattern, layout). The
+    regexes come from the assembly formats in debug8.ASM_FORMATS, so
+    anything debug8.inst_to_asm writes assembles back to the same
+    instruction"""
+    encoders = {}
+    for _, pattern, name, layout in chip8.OPCODES:
+        text = debug8.ASM_FORMATS[name][0]
+
+        regex = ""
+        for literal, field, _, _ in string.Formatter().parse(text):
+            literal = re.escape(literal).replace(",\\ ", r"\s*,\s*")
+            regex += literal.replace("\\ ", r"\s+")
+            if field is not None:
+                regex += operand_regex(field)
+
+        mnemonic = text.split()[0]
+        encoders.setdefault(mnemonic, []).append(
+            (re.compile(regex + "$", re.IGNORECASE), pattern, layout)
+        )
+    return encoders
+
+
+ENCODERS = build_encoders()
+
+
+def encode(text):
+    """return the instruction for a line of assembly, or None if it isn't
+    one. ERR: followed by a number is taken as a raw instruction, as
+    debug8.inst_to_asm writes for words that don't decode"""
+    mnemonic = text.split()[0].upper()
+
+    if mnemonic == "ERR:":
+        words = text.split()
+        if len(words) != 2 or not re.fullmatch(NUMBER, words[1], re.IGNORECASE):
+            return None
+        value = parse_number(words[1])
+        return value if value <= 0xFFFF else None
+
+    for regex, pattern, layout in ENCODERS.get(mnemonic, ()):
+        match = regex.match(text)
+        if match is None:
+            continue
+
+        inst = pattern
+        for name, value in zip(chip8.LAYOUTS[layout], match.groups()):
+            value = int(value, 16) if name in ("x", "y") else parse_number(value)
+            if value > LIMITS[name]:
+                return None
+            inst |= value << SHIFTS[name]
+        return inst
+
+    return None
+
+
+def assemble(source):
+    """assemble the text of a listing like the ones in asm/ into a program
+    to load at Chip.PROGRAM_MEM_INDEX. Each line is an optional address
+    then an instruction, and anything after a # is ignored. Lines without
+    an address follow on from the one before, and any gaps between
+    addresses are filled with zeros. Raises ValueError on a line that
+    can't be assembled"""
+    words = {}
+    address = chip8.Chip.PROGRAM_MEM_INDEX
+
+    for number, line in enumerate(source.splitlines(), 1):
+        line = line.split("#")[0].strip()
+        if not line:
+            continue
+
+        try:
+            first = line.split(maxsplit=1)
+            if first[0].lower().startswith("0x") and len(first) == 2:
+                address = int(first[0], 16)
+                line = first[1]
+
+            inst = encode(line)
+        except ValueError as e:
+            raise ValueError(f"line {number}: {e}") from None
+        if inst is None:
+            raise ValueError(f"line {number}: can't assemble {line!r}")
+        if address % 2 or not (
+            chip8.Chip.PROGRAM_MEM_INDEX <= address < chip8.Chip.RAM_SIZE - 1
+        ):
+            raise ValueError(f"line {number}: bad address {hex(address)}")
+        if address in words:
+            raise ValueError(f"line {number}: {hex(address)} is already used")
+
+        words[address] = inst
+        address += 2
+
+    if not words:
+        return b""
+
+    program = bytearray(max(words) + 2 - chip8.Chip.PROGRAM_MEM_INDEX)
+    for address, inst in words.items():
+        offset = address - chip8.Chip.PROGRAM_MEM_INDEX
+        program[offset : offset + 2] = inst.to_bytes(2, "big")
+    return bytes(program)
+
+
+_programs = {}
+# programs assembled in this process by cache key
+
+
+def assemble_file(path, cache_dir=CACHE_DIR):
+    """assemble a listing file, reusing the result from an earlier build of
+    the same source if there is one. Results are kept in memory and in
+    cache_dir, unless it's None, by the hash of the source"""
+    with open(path, "rb") as sourceFile:
+        source = sourceFile.read()
+    key = hashlib.sha256(b"%d\n" % VERSION + source).hexdigest()
+
+    program = _programs.get(key)
+    if program is not None:
+        return program
+
+    cached = None if cache_dir is None else os.path.join(cache_dir, key + ".ch8")
+    if cached is not None:
+        try:
+            with open(cached, "rb") as cachedFile:
+                program = cachedFile.read()
+        except OSError:
+            # the cache is only there to save time, so anything wrong with
+            # it is a miss
+            pass
+
+    if program is None:
+        program = assemble(source.decode())
+        if cached is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                # write then rename so a half written file is never read back
+                with open(cached + ".tmp", "wb") as cachedFile:
+                    cachedFile.write(program)
+                os.replace(cached + ".tmp", cached)
+            except OSError:
+                pass
+
+    _programs[key] = program
+    return program
+
+
+def init_argparse():
+    """create an argument parser"""
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [OPTION] SOURCE",
+        description="""Assemble a chip8 listing like the ones in asm/ into a rom
+            that emu8.py can run.""",
+    )
+    parser.add_argument("source", metavar="SOURCE", help="the listing to assemble")
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="file",
+        help="write the rom to a file (default SOURCE with a .ch8 extension)",
+    )
+    parser.add_argument(
+        "-nc",
+        "--nocache",
+        action="store_true",
+        help="assemble from scratch instead of reusing an earlier build",
+    )
+    return parser
+
+
+def main():
+    parser = init_argparse()
+    args = parser.parse_args()
+
+    try:
+        program = assemble_file(args.source, None if args.nocache else CACHE_DIR)
+    except ValueError as e:
+        parser.error(f"{args.source}: {e}")
+
+    output = args.output or os.path.splitext(args.source)[0] + ".ch8"
+    with open(output, "wb") as rom:
+        rom.write(program)
+
+
+if __name__ == "__main__":
+    main()
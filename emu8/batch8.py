@@ -0,0 +1,151 @@
+import chip8
+import headless8
+import argparse
+import hashlib
+import multiprocessing
+import os
+import time
+
+ROM_EXTENSIONS = (".ch8", ".c8")
+# files picked up when running every rom in a directory
+
+
+def find_roms(source):
+    """return the rom paths to run from a directory of roms or a manifest
+    file listing one rom per line. Paths in a manifest are relative to the
+    manifest and anything after a # is ignored"""
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name)
+            for name in os.listdir(source)
+            if name.lower().endswith(ROM_EXTENSIONS)
+        )
+
+    base = os.path.dirname(source)
+    roms = []
+    with open(source) as manifest:
+        for line in manifest:
+            line = line.split("#")[0].strip()
+            if line:
+                roms.append(os.path.join(base, line))
+    return roms
+
+
+def display_hash(chip):
+    """return a hash of the chip's display for comparing runs"""
+    rowBytes = (chip8.Chip.DISPLAY_X_MAX + 1) // 8
+    data = b"".join(row.to_bytes(rowBytes, "big") for row in chip.disp)
+    return hashlib.sha256(data).hexdigest()
+
+
+def run_rom(rom, max_cycles, clockSpeed=chip8.Chip.CLOCK_SPEED, seed=None):
+    """run a single rom headless for up to max_cycles and return a summary of
+    the run. Errors raised by the rom are recorded rather than raised"""
+    result = {"rom": rom, "cycles": 0, "seconds": 0.0, "exited": False}
+    chip = chip8.Chip(seed)
+    start = time.perf_counter()
+
+    try:
+        chip.load_rom(rom)
+        chip.clockSpeed = clockSpeed
+        chip.run_fast(max_cycles)
+        result["exited"] = chip.get_curr_inst() == chip8.Chip.EXIT
+        result["error"] = None
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["seconds"] = time.perf_counter() - start
+    result["cycles"] = chip.cycleCount
+    result["display"] = display_hash(chip)
+    return result
+
+
+def _run_rom(job):
+    """unpack a job tuple for the process pool"""
+    return run_rom(*job)
+
+
+def run_batch(
+    roms, max_cycles, clockSpeed=chip8.Chip.CLOCK_SPEED, jobs=None, seed=None
+):
+    """run every rom headless on a pool of worker processes, one per core
+    unless jobs is given. Every rom's random numbers come from seed if it's
+    given, so the report can be repeated. Returns a report with a result
+    for each rom, in the order given, and totals for the whole batch"""
+    start = time.perf_counter()
+    work = [(rom, max_cycles, clockSpeed, seed) for rom in roms]
+
+    with multiprocessing.Pool(jobs) as pool:
+        results = pool.map(_run_rom, work, chunksize=1)
+
+    elapsed = time.perf_counter() - start
+    cycles = sum(result["cycles"] for result in results)
+    return {
+        "roms": results,
+        "total": {
+            "roms": len(results),
+            "errors": sum(result["error"] is not None for result in results),
+            "cycles": cycles,
+            "seconds": elapsed,
+            "ips": cycles / elapsed if elapsed else 0.0,
+        },
+    }
+
+
+def init_argparse():
+    """create an argument parser"""
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [OPTION] SOURCE",
+        description="""Run a directory or manifest of chip8 roms headless across
+            every core and report the results as JSON.""",
+    )
+    parser.add_argument(
+        "source", metavar="SOURCE", help="a directory of roms or a file listing roms"
+    )
+    parser.add_argument(
+        "-mc",
+        "--maxcycles",
+        metavar="cycles",
+        type=int,
+        default=100000,
+        help="set the number of cycles to run each rom for (default 100000)",
+    )
+    parser.add_argument(
+        "-cs",
+        "--clockspeed",
+        metavar="Hz",
+        type=int,
+        default=chip8.Chip.CLOCK_SPEED,
+        help="set the emulated clock speed in Hz, used to time the timers (default 500)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="n",
+        type=int,
+        help="set the number of worker processes (default one per core)",
+    )
+    parser.add_argument(
+        "-sd",
+        "--seed",
+        metavar="n",
+        type=int,
+        help="seed the random numbers so runs can be repeated",
+    )
+    parser.add_argument(
+        "-o", "--output", metavar="file", help="write the report to a file instead of stdout"
+    )
+    return parser
+
+
+def main():
+    args = init_argparse().parse_args()
+
+    roms = find_roms(args.source)
+    report = run_batch(roms, args.maxcycles, args.clockspeed, args.jobs, args.seed)
+
+    headless8.write_result(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
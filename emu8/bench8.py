@@ -0,0 +1,298 @@
+import analyze8
+import asm8
+import chip8
+import demos8
+import headless8
+import jit8
+import trace8
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+ROUNDS = 5
+# timed rounds of each benchmark, the fastest is the one reported
+MIN_TIME = 0.05
+# seconds each round runs for at least
+EXECUTE_BATCH = 1000
+# instructions run back to back by each call in an execute benchmark
+HEADLESS_CYCLES = 100000
+# cycles run by each call in a headless benchmark
+THRESHOLD = 0.1
+# fraction a rate can drop by against the baseline before it's a regression
+ASM_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "asm")
+# listings of the games run by the headless benchmarks
+SEED = 0
+# seed for the random numbers in headless benchmarks, so each round does
+# the same work
+GAME_KEYS = {"breakout": [(0, 5, True)]}
+# keys held in the headless benchmarks of games that wait for one before
+# they start
+
+# operands used to build an instruction for each handler. The registers
+# hold values every handler can use, like key numbers for SKP
+FIELDS = {"x": 1, "y": 2, "kk": 0x05, "nnn": 0x300, "n": 5}
+
+# instructions run by the execute benchmark of a handler, in place of the
+# one built from FIELDS. CALL and RET run in pairs so the stack stays put,
+# and DRW draws across both edges onto itself so every row collides
+SEQUENCES = {
+    "CALL": (0x2300, 0x00EE),
+    "RET": None,
+    "DRW": (0xD345,),
+}
+
+
+def build_inst(pattern, layout):
+    """return the instruction for a handler's pattern with the operands in
+    FIELDS"""
+    shifts = {"x": 8, "y": 4, "kk": 0, "nnn": 0, "n": 0}
+    inst = pattern
+    for name in chip8.LAYOUTS[layout]:
+        inst |= FIELDS[name] << shifts[name]
+    return inst
+
+
+def bench_chip():
+    """return a chip set up for the execute benchmarks"""
+    chip = chip8.Chip()
+    chip.regs[1], chip.regs[2] = 5, 3
+    # v3 and v4 put a sprite over the bottom right corner
+    chip.regs[3], chip.regs[4] = 60, 30
+    chip.regI = 0x300
+    chip.load_mem(0x300, b"\xff" * 16)
+    return chip
+
+
+def execute_bench(insts):
+    """return a benchmark running a sequence of instructions through
+    Chip.execute"""
+    chip = bench_chip()
+    execute = chip.execute
+    batch = tuple(insts) * max(1, EXECUTE_BATCH // len(insts))
+
+    def run():
+        for inst in batch:
+            execute(inst)
+        return len(batch)
+
+    return run
+
+
+def load_bench():
+    """return a benchmark loading a program that fills memory"""
+    chip = chip8.Chip()
+    program = bytes(range(256)) * ((chip8.Chip.RAM_SIZE - 0x200) // 256)
+
+    def run():
+        chip.load_program(program)
+        return 1
+
+    return run
+
+
+def headless_bench(load, jit=False, keys=()):
+    """return a benchmark running a program headless from the start, as
+    loaded by a function like demos8.load_demo_count, with key events as
+    headless8.run_headless takes them"""
+    chip = chip8.Chip(SEED)
+
+    def run():
+        load(chip)
+        if jit:
+            jit8.Translator(chip).precompile(analyze8.analyze_chip(chip))
+        return headless8.run_headless(chip, HEADLESS_CYCLES, keys)["cycles"]
+
+    return run
+
+
+def replay_bench(data, jit=False):
+    """return a benchmark replaying a trace recorded by trace8.Recorder"""
+
+    def run():
+        return trace8.replay(data, jit)["cycles"]
+
+    return run
+
+
+def benchmarks(traces=()):
+    """return every benchmark as (name, unit, function returning a
+    benchmark), with replays of any trace files given"""
+    suite = []
+    for _, pattern, name, layout in chip8.OPCODES:
+        insts = SEQUENCES.get(name, (build_inst(pattern, layout),))
+        if insts is not None:
+            label = "CALL+RET" if name == "CALL" else name
+            suite.append(
+                (f"execute.{label}", "instructions", lambda i=insts: execute_bench(i))
+            )
+
+    suite.append(("load_program", "loads", load_bench))
+    demos = [("3", demos8.load_demo_3), ("count", demos8.load_demo_count)]
+    for game in ("pong", "breakout"):
+        program = asm8.assemble_file(os.path.join(ASM_DIR, game + ".asm"), None)
+        demos.append((game, lambda chip, p=program: chip.load_program(p)))
+    for demo, load in demos:
+        for jit in (False, True):
+            name = f"headless.{demo}.jit" if jit else f"headless.{demo}"
+            keys = GAME_KEYS.get(demo, ())
+            suite.append(
+                (
+                    name,
+                    "instructions",
+                    lambda l=load, j=jit, k=keys: headless_bench(l, j, k),
+                )
+            )
+
+    for path in traces:
+        with open(path, "rb") as trace:
+            data = trace.read()
+        base = f"replay.{os.path.splitext(os.path.basename(path))[0]}"
+        for jit in (False, True):
+            name = f"{base}.jit" if jit else base
+            suite.append(
+                (name, "instructions", lambda d=data, j=jit: replay_bench(d, j))
+            )
+    return suite
+
+
+def time_bench(run, rounds=ROUNDS, min_time=MIN_TIME):
+    """time a benchmark, a function that does some work and returns how many
+    operations it did. Each round calls it enough times to take at least
+    min_time. Returns the operations per round, the fastest and mean round
+    times and the operations per second of the fastest round"""
+    clock = time.perf_counter
+
+    calls = 1
+    while True:
+        start = clock()
+        ops = sum(run() for _ in range(calls))
+        elapsed = clock() - start
+        if elapsed >= min_time:
+            break
+        calls *= 2
+
+    times = [elapsed]
+    for _ in range(rounds - 1):
+        start = clock()
+        for _ in range(calls):
+            run()
+        times.append(clock() - start)
+
+    best = min(times)
+    return {
+        "ops": ops,
+        "rounds": rounds,
+        "best": best,
+        "mean": sum(times) / len(times),
+        "rate": ops / best,
+    }
+
+
+def run_suite(match=None, rounds=ROUNDS, min_time=MIN_TIME, traces=()):
+    """run every benchmark whose name contains match, or all of them, and
+    return the results by name"""
+    results = {}
+    for name, unit, make in benchmarks(traces):
+        if match is not None and match not in name:
+            continue
+        result = time_bench(make(), rounds, min_time)
+        result["unit"] = unit
+        results[name] = result
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """return the benchmarks whose rate dropped by more than threshold, as
+    a fraction, against a baseline report. Benchmarks missing from either
+    are left out"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("benchmarks", {}).get(name)
+        if old is None:
+            continue
+
+        change = result["rate"] / old["rate"] - 1
+        if change < -threshold:
+            regressions.append(
+                {
+                    "name": name,
+                    "baseline": old["rate"],
+                    "rate": result["rate"],
+                    "change": change,
+                }
+            )
+    return regressions
+
+
+def init_argparse():
+    """create an argument parser"""
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [OPTION]",
+        description="""Time the interpreter's instructions, program loading
+            and headless runs of the demos and games and report the rates as JSON.""",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        metavar="file",
+        help="compare against an earlier report and fail on regressions",
+    )
+    parser.add_argument(
+        "-th",
+        "--threshold",
+        metavar="fraction",
+        type=float,
+        default=THRESHOLD,
+        help="how far a rate can drop below the baseline (default 0.1)",
+    )
+    parser.add_argument(
+        "-m",
+        "--match",
+        metavar="text",
+        help="only run benchmarks with this in their name",
+    )
+    parser.add_argument(
+        "-tr",
+        "--trace",
+        metavar="file",
+        action="append",
+        default=[],
+        help="also time replays of a trace recorded with emu8.py --record",
+    )
+    parser.add_argument(
+        "-r",
+        "--rounds",
+        metavar="n",
+        type=int,
+        default=ROUNDS,
+        help="set the number of timed rounds of each benchmark (default 5)",
+    )
+    parser.add_argument(
+        "-o", "--output", metavar="file", help="write the report to a file instead of stdout"
+    )
+    return parser
+
+
+def main():
+    args = init_argparse().parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "benchmarks": run_suite(args.match, args.rounds, traces=args.trace),
+    }
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            report["regressions"] = compare(
+                report["benchmarks"], json.load(baseline), args.threshold
+            )
+
+    headless8.write_result(report, args.output)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
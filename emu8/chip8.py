@@ -1,4 +1,5 @@
 import random
+import struct
 import time
 
 
@@ -6,24 +7,36 @@ class Chip:
     # class constants
     CLOCK_SPEED = 500
     # default clock speed in Hz
+    TIMER_SPEED = 60
+    # rate the delay and sound timers count down at in Hz
     DIGIT_MEM_INDEX = 0
     # where in memory are the sprite reprs of digits
     PROGRAM_MEM_INDEX = 512
     # where is program space in memory
     RAM_SIZE = 4096
     # total bytes of ram
+    RANDOM_BATCH = 1024
+    # random bytes generated at a time for RND
     DISPLAY_X_MAX = 63
     # one less than the width of the display
     DISPLAY_Y_MAX = 31
     # one less than the height of the display
+    DISPLAY_ROW_MASK = (1 << (DISPLAY_X_MAX + 1)) - 1
+    # all the pixels in a display row
     EXIT = 0
     # instruction that ends program execution
+    BLANK_DISPLAY = (0,) * (DISPLAY_Y_MAX + 1)
+    # rows of a cleared display
+    ALL_ROWS = (1 << (DISPLAY_Y_MAX + 1)) - 1
+    # every row of the display, as a mask of dirty rows
 
-    def __init__(self):
+    def __init__(self, seed=None):
 
         # memory
-        self.mem = [0] * Chip.RAM_SIZE
+        self.mem = bytearray(Chip.RAM_SIZE)
         # main memory, each entry is one byte
+        self.memView = memoryview(self.mem)
+        # zero-copy view of memory for drivers to read from
         self.pc = Chip.PROGRAM_MEM_INDEX
         # program counter
 
@@ -54,23 +67,79 @@ class Chip:
         # these have to be set by a driver class
         self.keys = [False] * 16
 
+        # compiles and runs blocks of instructions in place of run_cycles,
+        # set by jit8.Translator
+        self.translator = None
+
+        # counters for instructions, draws and time, set by stats8.Stats
+        self.stats = None
+
+        # times each instruction in place of run_cycles and step, set by
+        # prof8.Profiler
+        self.profiler = None
+
+        # logs timer ticks and key changes so the run can be replayed, set
+        # by trace8.Recorder
+        self.recorder = None
+
+        # random number generator for RND, so a run can be repeated by
+        # seeding it
+        self.seed(seed)
+
         # initial memory values
         self.load_digit_sprites()
 
         # number of cycles run so far, used for timing
         self.cycleCount = 0
 
+        # number of draw and clear instructions run so far, so drivers can
+        # tell when the display has changed
+        self.drawCount = 0
+
         # set clock speed to default
         self.clockSpeed = Chip.CLOCK_SPEED
 
-        # load instruction code dictionaries for decoding
-        self.load_instruction_dicts()
+        # shared table of every opcode already decoded to a handler
+        self.decodeTable = decode_table()
+
+    def seed(self, seed=None):
+        """seed the generator RND draws from so its numbers can be
+        repeated, or seed it from the system if seed is None. The seed is
+        kept when a program is loaded"""
+        self.rngSeed = seed
+        # seed given, or None
+        self.rng = random.Random(seed)
+        self.randomBytes = b""
+        # bytes drawn from rng in bulk for RND, used up in order
+        self.randomPos = 0
+        # index of the next byte of randomBytes to use
 
     def load_display(self):
-        """load the display as an empty matrix"""
-        self.disp = []  # 2D boolean matrix representing the 63 x 32 display
-        for _ in range(Chip.DISPLAY_X_MAX + 1):
-            self.disp.append([False] * (Chip.DISPLAY_Y_MAX + 1))
+        """load the display as an empty list of rows"""
+        # each row of the 64 x 32 display is a 64-bit integer with the
+        # leftmost pixel in the most significant bit
+        self.disp = [0] * (Chip.DISPLAY_Y_MAX + 1)
+
+        # rows drawn to since a driver last took them, bit y for row y
+        self.dirtyRows = Chip.ALL_ROWS
+
+    def take_dirty_rows(self):
+        """return the mask of display rows drawn to since the last call, bit
+        y set for row y, and start tracking again from nothing"""
+        dirty = self.dirtyRows
+        self.dirtyRows = 0
+        return dirty
+
+    def get_pixel(self, x, y):
+        """return whether the pixel at x, y on the display is set"""
+        return (self.disp[y] >> (Chip.DISPLAY_X_MAX - x)) & 1 == 1
+
+    def get_display_matrix(self):
+        """return the display as a 2D boolean matrix indexed by x then y"""
+        return [
+            [self.get_pixel(x, y) for y in range(Chip.DISPLAY_Y_MAX + 1)]
+            for x in range(Chip.DISPLAY_X_MAX + 1)
+        ]
 
     def load_digit_sprites(self):
         """load the sprite reprentations of digits into memory for use
@@ -114,81 +183,86 @@ class Chip:
 
         self.load_mem(Chip.DIGIT_MEM_INDEX, digits)
 
-    def load_instruction_dicts(self):
-        """store dictionaries of instruction codes mapped to instructions for the decoding phase"""
-        self.no_params = {0x00E0: self.CLS, 0x00EE: self.RET}
-        self.addr_param = {0x1: self.JP, 0x2: self.CALL, 0xA: self.LDI, 0xB: self.JP0}
-
-        self.reg_val_params = {
-            0x3: self.SEval,
-            0x4: self.SNEval,
-            0x6: self.LDval,
-            0x7: self.ADDval,
-            0xC: self.RND,
-        }
-        self.reg_params = {
-            (0xE, 0x9E): self.SKP,
-            (0xE, 0xA1): self.SKNP,
-            (0xF, 0x07): self.LDregdt,
-            (0xF, 0x0A): self.LDkey,
-            (0xF, 0x15): self.LDdt,
-            (0xF, 0x18): self.LDst,
-            (0xF, 0x1E): self.ADDi,
-            (0xF, 0x29): self.LDdigit,
-            (0xF, 0x33): self.LDbcd,
-            (0xF, 0x55): self.LDmemreg,
-            (0xF, 0x65): self.LDregmem,
-        }
-        self.reg_reg_params = {
-            (0x5, 0x0): self.SEreg,
-            (0x8, 0x0): self.LDreg,
-            (0x8, 0x2): self.AND,
-            (0x8, 0x3): self.XOR,
-            (0x8, 0x4): self.ADDreg,
-            (0x8, 0x5): self.SUB,
-            (0x8, 0x6): self.SHR,
-            (0x8, 0x7): self.SUBN,
-            (0x8, 0xE): self.SHL,
-            (0x8, 0x1): self.OR,
-            (0x9, 0x0): self.SNEreg,
-        }
+    def snapshot(self):
+        """return the architectural state of the chip packed into bytes"""
+        return SNAPSHOT.pack(
+            self.mem,
+            bytes(self.regs),
+            *self.disp,
+            bytes(self.keys),
+            *self.stack,
+            self.regI,
+            self.pc,
+            self.sp,
+            self.dt,
+            self.st,
+            self.cycleCount,
+        )
+
+    def restore(self, snap):
+        """set the architectural state of the chip from a snapshot"""
+        fields = SNAPSHOT.unpack(snap)
+
+        self.mem[:] = fields[0]
+        self.regs = list(fields[1])
+        self.disp[:] = fields[2:34]
+        self.keys = [bool(key) for key in fields[34]]
+        self.stack = list(fields[35:51])
+        self.regI, self.pc, self.sp, self.dt, self.st, self.cycleCount = fields[51:]
+
+        # the display and any code may have changed
+        self.drawCount += 1
+        self.dirtyRows = Chip.ALL_ROWS
+        if self.translator is not None:
+            self.translator.invalidate(0, Chip.RAM_SIZE)
 
     def load_mem(self, offset, vals):
-        """load the values from an iterable into subsequent memory
-        locations. This is just memcpy."""
-        index = offset
-        for val in vals:
-            self.mem[index] = val
-            index += 1
+        """load a bytes-like object or iterable of bytes into subsequent
+        memory locations. This is just memcpy."""
+        vals = bytes(vals)
+        end = offset + len(vals)
+        if end > Chip.RAM_SIZE:
+            raise IndexError(f"{end - offset} bytes don't fit in memory at {offset}")
+
+        self.mem[offset:end] = vals
+        if self.translator is not None:
+            self.translator.invalidate(offset, end)
+
+    def dump_mem(self, start=0, end=RAM_SIZE):
+        """return a copy of memory from start up to end as bytes"""
+        return bytes(self.memView[start:end])
 
     def display_byte(self, x, y, b):
-        """set 'pixels' in the display according to a byte"""
-        ow = False
+        """xor a byte onto the display with its leftmost bit at x, y,
+        wrapping around the edges. Returns whether any pixel was erased"""
         y = y % (Chip.DISPLAY_Y_MAX + 1)
+        sprite = Chip.sprite_row(x, b)
 
-        for i in range(8):
-            p = b & (1 << (7 - i))  # isolate our bit
-            p = p >> (7 - i)  # shift our bit all the way right for 1 or 0
-            currx = (x + i) % (Chip.DISPLAY_X_MAX + 1)  # wrap around
+        ow = self.disp[y] & sprite
+        self.disp[y] ^= sprite
 
-            # are we overwritiing a previous sprite?
-            if p and self.disp[currx][y]:
-                ow = True
-                self.disp[currx][y] = False
-            elif p:
-                self.disp[currx][y] = True
+        return ow != 0
 
-        return ow
+    @staticmethod
+    def sprite_row(x, b):
+        """return a display row with byte b starting at column x, with any
+        bits past the right edge wrapped around to the left"""
+        x = x % (Chip.DISPLAY_X_MAX + 1)
+        b = b << Chip.DISPLAY_X_MAX - 7  # line the byte up with column 0
+        wrapped = b << (Chip.DISPLAY_X_MAX + 1 - x)
+        return ((b >> x) | wrapped) & Chip.DISPLAY_ROW_MASK
 
     def load_program(self, vals):
         """exposed method for loading a program into memory"""
-        self.__init__()
+        self.__init__(self.rngSeed)
         # reset everything
         # TODO: this resets clock speed, maybe it shouldn't
-        index = Chip.PROGRAM_MEM_INDEX
-        for val in vals:
-            self.mem[index] = val
-            index += 1
+        self.load_mem(Chip.PROGRAM_MEM_INDEX, vals)
+
+    def load_rom(self, path):
+        """load a program from a binary rom file"""
+        with open(path, "rb") as rom:
+            self.load_program(rom.read())
 
     def get_curr_inst(self):
         """return the current instruction pointed to by the program counter"""
@@ -202,85 +276,308 @@ class Chip:
         while self.mem[self.pc] != Chip.EXIT:
             self.cycle()
 
-    def cycle(self):
-        """run a single instruction with proper timing"""
+    def run_fast(self, max_cycles=None, before_frame=None):
+        """run instructions as fast as possible until the program exits or
+        max_cycles instructions have run, calling before_frame (if given)
+        before each 60Hz frame, or what's left of one from the last call.
+        Returns the number of cycles run, the time
+        taken and the instructions per second achieved.
+
+        Without before_frame or a recorder, waits on the delay timer skip
+        straight to the frame it runs out in."""
+        start = time.perf_counter()
+        startCount = self.cycleCount
+
+        while True:
+            inst = self.get_curr_inst()
+            if inst == Chip.EXIT:
+                break
+
+            if before_frame is not None:
+                before_frame()
+            if self.recorder is not None:
+                self.recorder.sync()
+
+            left = None
+            if max_cycles is not None:
+                left = max_cycles - (self.cycleCount - startCount)
+                if left <= 0:
+                    break
+
+            if before_frame is None and self.recorder is None and WAITS[inst]:
+                if self.idle_frames(left):
+                    continue
+
+            # frames come from the cycle count, so a run split over several
+            # calls counts the timers down on the same cycles as one call
+            end = self.frame_start(self.current_frame() + 1)
+            n = end - self.cycleCount
+            if left is not None:
+                n = min(n, left)
+
+            self.run_cycles(n)
+            if self.cycleCount == end:
+                self.tick_timers()
+
+        elapsed = time.perf_counter() - start
+        cycles = self.cycleCount - startCount
+        if self.stats is not None:
+            self.stats.add_time("execute", elapsed)
+        return {
+            "cycles": cycles,
+            "seconds": elapsed,
+            "ips": cycles / elapsed if elapsed else 0.0,
+        }
+
+    def frame_start(self, frame):
+        """return the cycle count a given 60Hz frame starts at, which is
+        when the timers count down at the end of the frame before it. This
+        spreads the clock speed over the frames of each second so no cycles
+        are lost when it doesn't divide evenly, and matches the cycles step
+        counts the timers down on"""
+        return -(-frame * self.clockSpeed // Chip.TIMER_SPEED)
+
+    def current_frame(self):
+        """return the 60Hz frame the cycle count is in"""
+        return self.cycleCount * Chip.TIMER_SPEED // self.clockSpeed
+
+    def frame_cycles(self, frame):
+        """return the number of instructions to run in a given 60Hz frame"""
+        return self.frame_start(frame + 1) - self.frame_start(frame)
+
+    def run_frame(self, n):
+        """run up to n instructions back to back then count the timers down
+        once. Returns the number of instructions run."""
+        ran = self.run_cycles(n)
+        self.tick_timers()
+        return ran
+
+    def run_cycles(self, n):
+        """run up to n instructions back to back without waiting or touching
+        the timers, stopping early if the program exits. Returns the number
+        of instructions run."""
+        if self.profiler is not None:
+            return self.profiler.run_cycles(n)
+        if self.translator is not None:
+            return self.translator.run_cycles(n)
+        return self.interpret(n)
+
+    def interpret(self, n):
+        """run up to n instructions one at a time through the decode table,
+        as run_cycles does without a translator"""
+        mem = self.mem
+        table = self.decodeTable
+        waits = WAITS
+        counts = None if self.stats is None else self.stats.opcodes
+        ran = 0
+
+        try:
+            while ran < n:
+                pc = self.pc
+                inst = (mem[pc] << 8) + mem[pc + 1]
+                if inst == Chip.EXIT:
+                    break
+
+                if waits[inst]:
+                    idle = self.idle_cycles(n - ran)
+                    if idle:
+                        ran += idle
+                        continue
+
+                op = table[inst]
+                if op is None:
+                    raise (Exception(f"Bad instruction: {inst}"))
+
+                op[0](self, *op[1])
+                if counts is not None:
+                    counts[inst] += 1
+                ran += 1
+        finally:
+            self.cycleCount += ran
+
+        return ran
+
+    def idle_cycles(self, n):
+        """check if the next instructions are a loop waiting on the delay
+        timer or a key press. The timers and keys only change between
+        frames, so the loop can't end in the next n cycles. Skips to the
+        state after those cycles and returns n, or returns 0 if there's no
+        loop to skip."""
+        # LD vX, K with nothing pressed doesn't move on
+        if self.get_curr_inst() & 0xF0FF == 0xF00A:
+            if any(self.keys):
+                return 0
+            if self.stats is not None:
+                self.stats.idleCycles += n
+            return n
+
+        wait = self.delay_wait()
+        if wait is None:
+            return 0
+        start, reg = wait
+
+        if self.stats is not None:
+            self.stats.idleCycles += n
+
+        # the load comes after whatever is left of the current pass
+        offset = (self.pc - start) // 2
+        if n > (3 - offset) % 3:
+            self.regs[reg] = self.dt
+        self.pc = start + 2 * ((offset + n) % 3)
+        return n
+
+    def idle_frames(self, max_cycles=None):
+        """check if the chip is waiting on the delay timer or a key press
+        and skip every frame until the wait ends, starting with what's left
+        of the current one and running no more than max_cycles. Keys can't
+        change while this runs, so a key wait is skipped up to max_cycles.
+        Returns the number of frames skipped."""
+        frame = self.current_frame()
+
+        # LD vX, K with nothing pressed, up to the last frame that fits
+        if self.get_curr_inst() & 0xF0FF == 0xF00A:
+            if any(self.keys) or max_cycles is None:
+                return 0
+            end = (self.cycleCount + max_cycles) * Chip.TIMER_SPEED
+            frames = end // self.clockSpeed - frame
+            if not frames:
+                return 0
+
+            n = self.frame_start(frame + frames) - self.cycleCount
+            if self.stats is not None:
+                self.stats.idleCycles += n
+            self.cycleCount += n
+            self.dt = max(0, self.dt - frames)
+            self.st = max(0, self.st - frames)
+            return frames
+
+        # each frame has to go round the loop at least once for the register
+        # to end up holding the last value of the timer
+        if self.clockSpeed < 3 * Chip.TIMER_SPEED:
+            return 0
+        if self.frame_start(frame + 1) - self.cycleCount < 3:
+            return 0
+
+        wait = self.delay_wait()
+        if wait is None:
+            return 0
+        start, reg = wait
+
+        def frame_span(frames):
+            return self.frame_start(frame + frames) - self.cycleCount
+
+        frames = self.dt
+        if max_cycles is not None:
+            while frames and frame_span(frames) > max_cycles:
+                frames -= 1
+            if not frames:
+                return 0
+
+        n = frame_span(frames)
+        if self.stats is not None:
+            self.stats.idleCycles += n
+
+        offset = (self.pc - start) // 2
+        self.regs[reg] = self.dt - frames + 1
+        self.pc = start + 2 * ((offset + n) % 3)
+        self.cycleCount += n
+        self.dt -= frames
+        self.st = max(0, self.st - frames)
+        return frames
+
+    def delay_wait(self):
+        """return the start address and register of the LD vX, DT / SE vX, 0
+        / JP loop the program counter is in, or None if it isn't in one or
+        the loop is about to end"""
+        mem = self.mem
+        pc = self.pc
         inst = self.get_curr_inst()
 
-        start = time.time()
-        self.execute(inst)
-        end = time.time()
+        if inst & 0xF0FF == 0xF007:
+            start = pc
+        elif inst & 0xF0FF == 0x3000:
+            start = pc - 2
+        elif inst == 0x1000 | (pc - 4):
+            start = pc - 4
+        else:
+            return None
 
-        elapsed = end - start
-        time.sleep((1 / self.clockSpeed) - elapsed)
-        self.cycleCount += 1
+        if start < 0 or start + 6 > Chip.RAM_SIZE or not self.dt:
+            return None
 
-        # decrement timers every 8 cycles. This is ~60Hz when
-        # clock speed is 500 Hz
-        if self.cycleCount % 8 == 0:
-            self.dt = max(0, self.dt - 1)
-            self.st = max(0, self.st - 1)
+        reg = mem[start] & 0x0F
+        if (mem[start] << 8) + mem[start + 1] != 0xF007 | reg << 8:
+            return None
+        if (mem[start + 2] << 8) + mem[start + 3] != 0x3000 | reg << 8:
+            return None
+        if (mem[start + 4] << 8) + mem[start + 5] != 0x1000 | start:
+            return None
 
-    def execute(self, inst):
-        """execute a single 16-bit integer instruction on the chip"""
-        # data so we don't reload them every cycle?
+        # the skip only falls through if the register doesn't already hold
+        # a stale 0
+        if pc == start + 2 and not self.regs[reg]:
+            return None
+        return start, reg
 
-        # if we're at an exit code, don't do anything
-        if inst == Chip.EXIT:
-            return
+    def cycle(self):
+        """run a single instruction with proper timing"""
+        start = time.perf_counter()
+        self.step()
+        elapsed = time.perf_counter() - start
 
-        # instructions with no params
-        if inst in self.no_params:
-            self.no_params[inst]()
-            return
+        # if the instruction took longer than a cycle, don't wait at all
+        delay = max(0, (1 / self.clockSpeed) - elapsed)
+        time.sleep(delay)
 
-        # instructions with a single 12 bit param (address)
-        prefix = inst >> 12  # first 4 bits encode instruction type
-        addr = inst & 0x0FFF  # last 12 bits encode param
+        if self.stats is not None:
+            self.stats.add_time("execute", elapsed)
+            self.stats.add_time("sleep", delay)
 
-        if prefix in self.addr_param:
-            self.addr_param[prefix](addr)
-            return
+    def step(self):
+        """run a single instruction without waiting"""
+        inst = self.get_curr_inst()
+        if self.profiler is not None:
+            self.profiler.execute(inst)
+        else:
+            self.execute(inst)
+        self.cycleCount += 1
+        if self.stats is not None:
+            self.stats.opcodes[inst] += 1
 
-        # instructions with a 4-bit param (register) and 8-bit param (literal)
-        reg = addr >> 8
-        # middle 4 bits encode register
-        val = addr & 0x0FF
-        # last 8 bits encode literal byte
+        # decrement timers whenever the cycle count crosses another 60th of
+        # a second of emulated time. This is every 8 or 9 cycles at 500 Hz
+        if (self.cycleCount * Chip.TIMER_SPEED) % self.clockSpeed < Chip.TIMER_SPEED:
+            self.tick_timers()
 
-        if prefix in self.reg_val_params:
-            self.reg_val_params[prefix](reg, val)
-            return
+    def tick_timers(self):
+        """count the delay and sound timers down by one"""
+        self.dt = max(0, self.dt - 1)
+        self.st = max(0, self.st - 1)
+        if self.recorder is not None:
+            self.recorder.tick()
 
-        # instructions with a single 4-bit param (register)
-        postfix = val
-        # what was a literal value before is now a postfix
+    def execute(self, inst):
+        """execute a single 16-bit integer instruction on the chip"""
 
-        if (prefix, postfix) in self.reg_params:
-            self.reg_params[(prefix, postfix)](reg)
+        # if we're at an exit code, don't do anything
+        if inst == Chip.EXIT:
             return
 
-        # instructions with two 4-bit parameters (registers)
-        reg1 = reg  # rename since there's now 2 registers
-        reg2 = postfix >> 4  # second param is third set of 4 bits
-        postfix = postfix & 0x0F
-        # now the postfix is only 4 bits
-
-        if (prefix, postfix) in self.reg_reg_params:
-            self.reg_reg_params[(prefix, postfix)](reg1, reg2)
-            return
+        op = self.decodeTable[inst]
 
-        # instructions with 3 4-bit parameters (two registers, one 'nibble')
-        nibble = postfix
-        if prefix == 0xD:
-            self.DRW(reg1, reg2, nibble)
-            return
+        # if it wasn't decoded, it doesn't exist
+        if op is None:
+            raise (Exception(f"Bad instruction: {inst}"))
 
-        # if it hasn't been decoded yet, it doesn't exist
-        raise (Exception(f"Bad instruction: {inst}"))
+        op[0](self, *op[1])
 
     def CLS(self):
         """instruction to clear the display"""
-        self.load_display()
+        self.disp[:] = Chip.BLANK_DISPLAY
+        self.dirtyRows = Chip.ALL_ROWS
+        self.drawCount += 1
+        if self.stats is not None:
+            self.stats.clears += 1
         self.pc += 2
 
     def RET(self):
@@ -431,27 +728,52 @@ class Chip:
     def RND(self, reg, b):
         """instruction to generate a random byte, bitwise and it with a given
         byte and store the result"""
-        r = random.randint(0, 255)
-        self.regs[reg] = r & b
+        pos = self.randomPos
+        if pos == len(self.randomBytes):
+            self.randomBytes = self.rng.randbytes(Chip.RANDOM_BATCH)
+            pos = 0
+        self.regs[reg] = self.randomBytes[pos] & b
+        self.randomPos = pos + 1
         self.pc += 2
 
     def DRW(self, reg1, reg2, n):
         """instruction to draw a sprite on the display"""
-        x, y = self.regs[reg1], self.regs[reg2]
+        x, y = self.regs[reg1] % (Chip.DISPLAY_X_MAX + 1), self.regs[reg2]
+        disp = self.disp
+        mem = self.mem
         index = self.regI
-        ow = False
+        shift = Chip.DISPLAY_X_MAX - 7 - x  # where the byte sits in the row
+        ow = 0
 
         for i in range(n):
-            b = self.mem[index]
-            if self.display_byte(x, y + i, b):
-                ow = True
-            index += 1
+            row = (y + i) % (Chip.DISPLAY_Y_MAX + 1)
+            b = mem[index + i]
+
+            # move the byte to column x, wrapping around the right edge
+            if shift >= 0:
+                sprite = b << shift
+            else:
+                sprite = (b >> -shift) | (
+                    (b << (Chip.DISPLAY_X_MAX + 1 + shift)) & Chip.DISPLAY_ROW_MASK
+                )
+
+            ow |= disp[row] & sprite
+            disp[row] ^= sprite
 
         if ow:
             self.regs[15] = 1
         else:
             self.regs[15] = 0
 
+        # mark the n rows from y, wrapping past the bottom to the top
+        rows = ((1 << n) - 1) << (y % (Chip.DISPLAY_Y_MAX + 1))
+        self.dirtyRows |= (rows | rows >> (Chip.DISPLAY_Y_MAX + 1)) & Chip.ALL_ROWS
+
+        self.drawCount += 1
+        if self.stats is not None:
+            self.stats.sprites += 1
+            sprite = int.from_bytes(mem[index : index + n], "big")
+            self.stats.pixels += sprite.bit_count()
         self.pc += 2
 
     def SKP(self, reg):
@@ -528,6 +850,8 @@ class Chip:
         self.mem[self.regI + 1] = tens
         self.mem[self.regI + 2] = ones
 
+        if self.translator is not None:
+            self.translator.invalidate(self.regI, self.regI + 3)
         self.pc += 2
 
     def LDmemreg(self, reg):
@@ -537,6 +861,9 @@ class Chip:
         for r in range(0, reg + 1):
             self.mem[loc] = self.regs[r]
             loc += 1
+
+        if self.translator is not None:
+            self.translator.invalidate(self.regI, loc)
         self.pc += 2
 
     def LDregmem(self, reg):
@@ -549,6 +876,118 @@ class Chip:
         self.pc += 2
 
 
+# layout of Chip.snapshot(): memory, registers, display rows, keys, stack,
+# I, program counter, stack pointer, delay timer, sound timer, cycle count
+SNAPSHOT = struct.Struct(
+    f"<{Chip.RAM_SIZE}s16s{Chip.DISPLAY_Y_MAX + 1}Q16s16HHHbBBQ"
+)
+
+
+# every instruction as (mask, pattern, handler name, operand layout).
+# An instruction matches when inst & mask == pattern. Operand layouts are
+# "nnn" for a 12-bit address, "x" and "y" for registers, "kk" for a byte
+# and "n" for a nibble.
+OPCODES = (
+    (0xFFFF, 0x00E0, "CLS", ""),
+    (0xFFFF, 0x00EE, "RET", ""),
+    (0xF000, 0x1000, "JP", "nnn"),
+    (0xF000, 0x2000, "CALL", "nnn"),
+    (0xF000, 0x3000, "SEval", "xkk"),
+    (0xF000, 0x4000, "SNEval", "xkk"),
+    (0xF00F, 0x5000, "SEreg", "xy"),
+    (0xF000, 0x6000, "LDval", "xkk"),
+    (0xF000, 0x7000, "ADDval", "xkk"),
+    (0xF00F, 0x8000, "LDreg", "xy"),
+    (0xF00F, 0x8001, "OR", "xy"),
+    (0xF00F, 0x8002, "AND", "xy"),
+    (0xF00F, 0x8003, "XOR", "xy"),
+    (0xF00F, 0x8004, "ADDreg", "xy"),
+    (0xF00F, 0x8005, "SUB", "xy"),
+    (0xF00F, 0x8006, "SHR", "xy"),
+    (0xF00F, 0x8007, "SUBN", "xy"),
+    (0xF00F, 0x800E, "SHL", "xy"),
+    (0xF00F, 0x9000, "SNEreg", "xy"),
+    (0xF000, 0xA000, "LDI", "nnn"),
+    (0xF000, 0xB000, "JP0", "nnn"),
+    (0xF000, 0xC000, "RND", "xkk"),
+    (0xF000, 0xD000, "DRW", "xyn"),
+    (0xF0FF, 0xE09E, "SKP", "x"),
+    (0xF0FF, 0xE0A1, "SKNP", "x"),
+    (0xF0FF, 0xF007, "LDregdt", "x"),
+    (0xF0FF, 0xF00A, "LDkey", "x"),
+    (0xF0FF, 0xF015, "LDdt", "x"),
+    (0xF0FF, 0xF018, "LDst", "x"),
+    (0xF0FF, 0xF01E, "ADDi", "x"),
+    (0xF0FF, 0xF029, "LDdigit", "x"),
+    (0xF0FF, 0xF033, "LDbcd", "x"),
+    (0xF0FF, 0xF055, "LDmemreg", "x"),
+    (0xF0FF, 0xF065, "LDregmem", "x"),
+)
+
+# set for the instructions that can be part of a loop skipped by
+# Chip.idle_cycles, LD vX, DT, SE vX, 0 and LD vX, K
+WAITS = bytes(
+    inst & 0xF0FF in (0xF007, 0x3000, 0xF00A) for inst in range(0x10000)
+)
+
+# names of the operands for each operand layout, in argument order
+LAYOUTS = {
+    "": (),
+    "nnn": ("nnn",),
+    "xkk": ("x", "kk"),
+    "x": ("x",),
+    "xy": ("x", "y"),
+    "xyn": ("x", "y", "n"),
+}
+
+
+def decode_operands(inst, layout):
+    """pull the operands for a given layout out of an instruction"""
+    if layout == "nnn":
+        return (inst & 0x0FFF,)
+
+    x = (inst >> 8) & 0x0F
+    if layout == "xkk":
+        return (x, inst & 0x00FF)
+    elif layout == "x":
+        return (x,)
+
+    y = (inst >> 4) & 0x0F
+    if layout == "xy":
+        return (x, y)
+    elif layout == "xyn":
+        return (x, y, inst & 0x000F)
+
+    return ()
+
+
+_decodeTable = None
+
+
+def decode_table():
+    """return a list indexed by instruction of (handler, operands, name,
+    layout) tuples, or None for instructions that don't exist. The table
+    is built on first use and shared by every chip."""
+    global _decodeTable
+
+    if _decodeTable is None:
+        table = [None] * 0x10000
+        for mask, pattern, name, layout in OPCODES:
+            handler = getattr(Chip, name)
+            free = ~mask & 0xFFFF  # bits holding operands
+            for inst in range(pattern, pattern + free + 1):
+                if inst & mask == pattern:
+                    table[inst] = (
+                        handler,
+                        decode_operands(inst, layout),
+                        name,
+                        layout,
+                    )
+        _decodeTable = table
+
+    return _decodeTable
+
+
 def main():
     chip = Chip()
     chip.LDkey(0)
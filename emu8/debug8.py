@@ -1,232 +1,278 @@
-import tui8
+import chip8
 import sys
 
 
+# assembly and description formats for each handler in chip8.OPCODES
+ASM_FORMATS = {
+    "CLS": ("CLS", "clear the display"),
+    "RET": ("RET", "return from a subroutine"),
+    "JP": ("JP {nnn}", "jump to instruction at {nnn}"),
+    "CALL": ("CALL {nnn}", "call subroutine at {nnn}"),
+    "SEval": (
+        "SE v{x}, {kk}",
+        "skip the next instruction if v{x} and {kk} have the same value",
+    ),
+    "SNEval": (
+        "SNE v{x}, {kk}",
+        "skip the next instruction if v{x} and {kk} do not have the same value",
+    ),
+    "SEreg": (
+        "SE v{x}, v{y}",
+        "skip the next instruction if the values in v{x} and v{y} are equal",
+    ),
+    "LDval": ("LD v{x}, {kk}", "load the value {kk} into v{x}"),
+    "ADDval": ("ADD v{x}, {kk}", "add the value {kk} to v{x}"),
+    "LDreg": ("LD v{x}, v{y}", "load the value from v{y} into v{x}"),
+    "OR": (
+        "OR v{x}, v{y}",
+        "bitwise OR the values in v{x} and v{y} and store the result in v{x}",
+    ),
+    "AND": (
+        "AND v{x}, v{y}",
+        "bitwise AND the values in v{x} and v{y} and store the result in v{x}",
+    ),
+    "XOR": (
+        "XOR v{x}, v{y}",
+        "bitwise XOR the values in v{x} and v{y} and store the result in v{x}",
+    ),
+    "ADDreg": ("ADD v{x}, v{y}", "add the value from v{y} to v{x}"),
+    "SUB": ("SUB v{x}, v{y}", "subtract the value in v{y} from v{x}"),
+    "SHR": (
+        "SHR v{x}, v{y}",
+        "divide the value in v{x} by 2, store the result in v{x}, and set VF accordingly",
+    ),
+    "SUBN": (
+        "SUBN v{x}, v{y}",
+        "set v{x} to v{y} minus v{x} and set VF to NOT borrow",
+    ),
+    "SHL": (
+        "SHL v{x}, v{y}",
+        "the value in v{x} is multiplied by 2 and stored in v{x} and VF is set to overflow",
+    ),
+    "SNEreg": (
+        "SNE v{x}, v{y}",
+        "skip the next instruction if the values in v{x} and v{y} are not equal",
+    ),
+    "LDI": ("LD I, {nnn}", "load the value {nnn} into the I register"),
+    "JP0": ("JP V0, {nnn}", "jump to {nnn} plus the value in V0"),
+    "RND": (
+        "RND v{x}, {kk}",
+        "generate a random byte, bitewise and it with {kk} and store it in v{x}",
+    ),
+    "DRW": (
+        "DRW v{x}, v{y}, {n}",
+        "draw {n} bytes on the display at coordinates stored in v{x}, v{y}",
+    ),
+    "SKP": (
+        "SKP v{x}",
+        "skip the next instruction if the key in v{x} is being pressed",
+    ),
+    "SKNP": (
+        "SKNP v{x}",
+        "skip the next instruction if the key in v{x} is not being pressed",
+    ),
+    "LDregdt": ("LD v{x}, DT", "load the value in DT into v{x}"),
+    "LDkey": ("LD v{x}, K", "wait for a keypress then store the key in v{x}"),
+    "LDdt": ("LD DT, v{x}", "load the value from v{x} into DT"),
+    "LDst": ("LD ST, v{x}", "load the value from v{x} into ST"),
+    "ADDi": ("ADD I, v{x}", "add the value in v{x} to the I register"),
+    "LDdigit": (
+        "LD F, v{x}",
+        "set I to the location of the digit for the value stored in v{x}",
+    ),
+    "LDbcd": (
+        "LD B, v{x}",
+        "convert the value in v{x} to decimal and store the digits in memory at I through I+2",
+    ),
+    "LDmemreg": (
+        "LD [I], v{x}",
+        "store the values in registers v0 through v{x} in memory starting at the address in I",
+    ),
+    "LDregmem": (
+        "LD v{x}, [I]",
+        "read memory into registers v0 through v{x} starting at the address in I",
+    ),
+}
+
+
+# hex labels for every byte and address, as double_hex and triple_hex write
+# them
+BYTE_HEX = tuple(f"0x{n:02x}" for n in range(0x100))
+ADDR_HEX = tuple(f"0x{n:03x}" for n in range(chip8.Chip.RAM_SIZE))
+
+
+def double_hex(n):
+    """return a two digit hex representation of an integer"""
+    if 0 <= n < len(BYTE_HEX):
+        return BYTE_HEX[n]
+    h = hex(n)
+    if len(h) == 3:
+        h = h[:2] + "0" + h[2]
+    return h
+
+
+def triple_hex(n):
+    """return a three digit hex representation of an integer"""
+    if 0 <= n < len(ADDR_HEX):
+        return ADDR_HEX[n]
+    h = double_hex(n)
+    if len(h) == 4:
+        h = h[:2] + "0" + h[2:]
+    return h
+
+
+def format_operands(operands, layout):
+    """return the text for each decoded operand keyed by its name in the
+    layout"""
+    fields = {}
+    for name, val in zip(chip8.LAYOUTS[layout], operands):
+        if name == "nnn":
+            fields[name] = triple_hex(val)
+        elif name == "kk":
+            fields[name] = double_hex(val)
+        elif name == "n":
+            fields[name] = str(val)
+        else:  # registers are a single hex digit
+            fields[name] = hex(val)[-1]
+    return fields
+
+
 def inst_to_asm(inst):
     """convert a two-byte integer instruction to chip-8 assembly"""
 
     if inst > ((0xFF << 8) + 0xFF):
         raise (Exception(f"value too large: {hex(inst)}"))
 
-    # instructions with 0 params
-    if inst == 0x00E0:
-        return "CLS"
-    elif inst == 0x00EE:
-        return "RET"
-
-    # single parameter (12-bit address)
-    prefix = inst >> 12
-    addr = inst & 0x0FFF
-    if prefix == 0x1:
-        return f"JP {tui8.Tui.triple_hex(addr)}"
-    elif prefix == 0x2:
-        return f"CALL {tui8.Tui.triple_hex(addr)}"
-    elif prefix == 0xA:
-        return f"LD I, {tui8.Tui.triple_hex(addr)}"
-    elif prefix == 0xB:
-        return f"JP V0, {tui8.Tui.triple_hex(addr)}"
-
-    # two parameters, one of which is a register and the other is a value
-    reg = addr >> 8
-    val = addr & 0x0FF
-    if prefix == 0x3:
-        return f"SE v{hex(reg)[-1]}, {tui8.Tui.double_hex(val)}"
-    elif prefix == 0x4:
-        return f"SNE v{hex(reg)[-1]}, {tui8.Tui.double_hex(val)}"
-    elif prefix == 0x6:
-        return f"LD v{hex(reg)[-1]}, {tui8.Tui.double_hex(val)}"
-    elif prefix == 0x7:
-        return f"ADD v{hex(reg)[-1]}, {tui8.Tui.double_hex(val)}"
-    elif prefix == 0xC:
-        return f"RND v{hex(reg)[-1]}, {tui8.Tui.double_hex(val)}"
-
-    # one parameter which is a single register
-    postfix = val
-    if prefix == 0xE:
-        if postfix == 0x9E:
-            return f"SKP v{hex(reg)[-1]}"
-        elif postfix == 0xA1:
-            return f"SKNP v{hex(reg)[-1]}"
-    elif prefix == 0xF:
-        if postfix == 0x07:
-            return f"LD v{hex(reg)[-1]}, DT"
-        elif postfix == 0x0A:
-            return f"LD v{hex(reg)[-1]}, K"
-        elif postfix == 0x15:
-            return f"LD DT, v{hex(reg)[-1]}"
-        elif postfix == 0x18:
-            return f"LD ST, v{hex(reg)[-1]}"
-        elif postfix == 0x1E:
-            return f"ADD I, v{hex(reg)[-1]}"
-        elif postfix == 0x29:
-            return f"LD F, v{hex(reg)[-1]}"
-        elif postfix == 0x33:
-            return f"LD B, v{hex(reg)[-1]}"
-        elif postfix == 0x55:
-            return f"LD [I], v{hex(reg)[-1]}"
-        elif postfix == 0x65:
-            return f"LD v{hex(reg)[-1]}, [I]"
-
-    # two parameters, both of which are registers
-    reg1 = reg
-    reg2 = postfix >> 4
-    postfix = postfix & 0x0F
-    if prefix == 0x5 and postfix == 0x0:
-        return f"SE v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
-    elif prefix == 0x8:
-        if postfix == 0x0:
-            return f"LD v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
-        elif postfix == 0x1:
-            return f"OR v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
-        elif postfix == 0x2:
-            return f"AND v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
-        elif postfix == 0x3:
-            return f"XOR v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
-        elif postfix == 0x4:
-            return f"ADD v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
-        elif postfix == 0x5:
-            return f"SUB v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
-        elif postfix == 0x6:
-            return f"SHR v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
-        elif postfix == 0x7:
-            return f"SUBN v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
-        elif postfix == 0xE:
-            return f"SHL v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
-    elif prefix == 0x9 and postfix == 0x0:
-        return f"SNE v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
-
-    # three parameters, 2 of which are registers and one of which is a byte
-    nibble = postfix
-    if prefix == 0xD:
-        return f"DRW v{hex(reg1)[-1]}, v{hex(reg2)[-1]}, {nibble}"
+    op = chip8.decode_table()[inst]
 
     # invalid instruction
-    else:
+    if op is None:
         return f"ERR: {hex(inst)}"
 
+    _, operands, name, layout = op
+    return ASM_FORMATS[name][0].format(**format_operands(operands, layout))
+
 
 def inst_to_asmdesc(inst):
     """convert a two-byte integer instruction to a
     description of the chip-8 assemly instruction"""
 
-    # instructions with 0 params
-    if inst == 0x00E0:
-        return "clear the display"
-    elif inst == 0x00EE:
-        return "return from a subroutine"
-
-    # single parameter (12-bit address)
-    prefix = inst >> 12
-    addr = inst & 0x0FFF
-    if prefix == 0x1:
-        return f"jump to instruction at {tui8.Tui.triple_hex(addr)}"
-    elif prefix == 0x2:
-        return f"call subroutine at {tui8.Tui.triple_hex(addr)}"
-    elif prefix == 0xA:
-        return f"load the value {tui8.Tui.triple_hex(addr)} into the I register"
-    elif prefix == 0xB:
-        return f"jump to {tui8.Tui.triple_hex(addr)} plus the value in V0"
-
-    # two parameters, one of which is a register and the other is a value
-    reg = addr >> 8
-    val = addr & 0x0FF
-    if prefix == 0x3:
-        return f"skip the next instruction if v{hex(reg)[-1]} and {tui8.Tui.double_hex(val)} have the same value"
-    elif prefix == 0x4:
-        return f"skip the next instruction if v{hex(reg)[-1]} and {tui8.Tui.double_hex(val)} do not have the same value"
-    elif prefix == 0x6:
-        return f"load the value {tui8.Tui.double_hex(val)} into v{hex(reg)[-1]}"
-    elif prefix == 0x7:
-        return f"add the value {tui8.Tui.double_hex(val)} to v{hex(reg)[-1]}"
-    elif prefix == 0xC:
-        return f"generate a random byte, bitewise and it with {tui8.Tui.double_hex(val)} and store it in v{hex(reg)[-1]}"
-
-    # one parameter which is a single register
-    postfix = val
-    if prefix == 0xE:
-        if postfix == 0x9E:
-            return f"skip the next instruction if the key in v{hex(reg)[-1]} is being pressed"
-        elif postfix == 0xA1:
-            return f"skip the next instruction if the key in v{hex(reg)[-1]} is not being pressed"
-    elif prefix == 0xF:
-        if postfix == 0x07:
-            return f"load the value in DT into v{hex(reg)[-1]}"
-        elif postfix == 0x0A:
-            return f"wait for a keypress then store the key in  v{hex(reg)[-1]}"
-        elif postfix == 0x15:
-            return f"load the value from v{hex(reg)[-1]} into DT"
-        elif postfix == 0x18:
-            return f"load the value from v{hex(reg)[-1]} into ST"
-        elif postfix == 0x1E:
-            return f"add the value in v{hex(reg)[-1]} to the I register"
-        elif postfix == 0x29:
-            return f"set I to the location of the digit for the value stored in v{hex(reg)[-1]}"
-        elif postfix == 0x33:
-            return f"convert the value in v{hex(reg)[-1]} to decimal and store the digits in memory at I through I+2"
-        elif postfix == 0x55:
-            return f"store the values in registers v0 through v{hex(reg)[-1]} in memory starting at the address in I"
-        elif postfix == 0x65:
-            return f"read memory into registers v0 through v{hex(reg)[-1]} starting at the address in I"
-
-    # two parameters, both of which are registers
-    reg1 = reg
-    reg2 = postfix >> 4
-    postfix = postfix & 0x0F
-    if prefix == 0x5 and postfix == 0x0:
-        return f"skip the next instruction if the values in v{hex(reg1)[-1]} and v{hex(reg2)[-1]} are equal"
-    elif prefix == 0x8:
-        if postfix == 0x0:
-            return f"load the value from v{hex(reg2)[-1]} into v{hex(reg2)[-1]}"
-        elif postfix == 0x1:
-            return f"bitwise OR the values in v{hex(reg1)[-1]} and v{hex(reg2)[-1]} and store the result in v{hex(reg1)[-1]}"
-        elif postfix == 0x2:
-            return f"bitwise AND the values in v{hex(reg1)[-1]} and v{hex(reg2)[-1]} and store the result in v{hex(reg1)[-1]}"
-        elif postfix == 0x3:
-            return f"bitwise XOR the values in v{hex(reg1)[-1]} and v{hex(reg2)[-1]} and store the result in v{hex(reg1)[-1]}"
-        elif postfix == 0x4:
-            return f"add the value from v{hex(reg2)[-1]} to v{hex(reg2)[-1]}"
-        elif postfix == 0x5:
-            return f"subtract the value in v{hex(reg2)[-1]} from v{hex(reg1)[-1]}"
-        elif postfix == 0x6:
-            return f"divide the value in v{hex(reg1)[-1]} by 2, store the result in v{hex(reg1)[-1]}, and set VF accordingly"
-        elif postfix == 0x7:
-            return f"set v{hex(reg1)[-1]} to v{hex(reg2)[-1]} minus v{hex(reg1)[-1]} and set VF to NOT borrow"
-        elif postfix == 0xE:
-            return f"the value in v{hex(reg1)[-1]} is multiplied by 2 and stored in v{hex(reg1)[-1]} and VF is set to overflow"
-    elif prefix == 0x9 and postfix == 0x0:
-        return f"skip the next instruction if the values in v{hex(reg1)[-1]} and v{hex(reg2)[-1]} are not equal"
-
-    # three parameters, 2 of which are registers and one of which is a byte
-    nibble = postfix
-    if prefix == 0xD:
-        return f"draw {nibble} bytes on the display at coordinates stored in v{hex(reg1)[-1]}, v{hex(reg2)[-1]}"
+    op = chip8.decode_table()[inst]
 
     # invalid instruction
-    else:
+    if op is None:
         return "invalid instruction"
 
+    _, operands, name, layout = op
+    return ASM_FORMATS[name][1].format(**format_operands(operands, layout))
 
-def decompile(infile, outfile):
-    """decompile a ch8 binary back into an assembly file"""
 
-    with open(infile, "rb") as inf:
-        with open(outfile, "w") as outf:
+_asmTable = [None] * 0x10000
+# assembly for every instruction, filled in by asm_text as each is first
+# seen so nothing has to be built up front
+_descTable = [None] * 0x10000
+# descriptions for every instruction, filled in by desc_text the same way
+
+
+def asm_text(inst):
+    """return the assembly for an instruction as inst_to_asm does,
+    remembering it for the next time"""
+    text = _asmTable[inst]
+    if text is None:
+        text = _asmTable[inst] = inst_to_asm(inst)
+    return text
+
 
-            memloc = 0x200  # we include memory location for easier debugging
-            while data := inf.read(1):
-                prefix = data
-                postfix = inf.read(1)
-                if not postfix:
-                    postfix = b"\x00"
+def desc_text(inst):
+    """return the description of an instruction as inst_to_asmdesc does,
+    remembering it for the next time"""
+    text = _descTable[inst]
+    if text is None:
+        text = _descTable[inst] = inst_to_asmdesc(inst)
+    return text
 
-                instcode = (int.from_bytes(prefix, "big") << 8) + int.from_bytes(
-                    postfix, "big"
-                )
 
-                outf.write(hex(memloc) + "\t")
-                outf.write(inst_to_asm(instcode) + "\n")
+# instructions that skip the one after them, so both it and the one after
+# that can run next
+SKIPS = ("SEval", "SNEval", "SEreg", "SNEreg", "SKP", "SKNP")
+
+
+def find_code(data, start=chip8.Chip.PROGRAM_MEM_INDEX):
+    """follow every path through a rom loaded at start, through jumps,
+    calls and skips, to separate instructions from data. Returns the
+    addresses reached as instructions, the addresses jumped to and the
+    addresses called. Paths end at an exit, a return, an instruction that
+    doesn't decode or a JP V0, which can go anywhere"""
+    table = chip8.decode_table()
+    end = start + len(data) - 1
+    code, jumps, calls = set(), set(), set()
+    todo = [start]
+
+    while todo:
+        addr = todo.pop()
+        while start <= addr < end and addr % 2 == 0 and addr not in code:
+            offset = addr - start
+            op = table[(data[offset] << 8) + data[offset + 1]]
+            if op is None:
+                break
+            code.add(addr)
+
+            _, operands, name, _ = op
+            if name == "JP":
+                jumps.add(operands[0])
+                todo.append(operands[0])
+                break
+            if name in ("RET", "JP0"):
+                break
+            if name == "CALL":
+                calls.add(operands[0])
+                todo.append(operands[0])
+            elif name in SKIPS:
+                todo.append(addr + 4)
+            addr += 2
+
+    return code, jumps, calls
+
+
+# each byte drawn as a row of sprite pixels
+SPRITE_ROWS = tuple(
+    format(b, "08b").replace("0", ".").replace("1", "#") for b in range(256)
+)
+
+
+def disassemble(data, start=chip8.Chip.PROGRAM_MEM_INDEX):
+    """yield the lines of a listing of a rom loaded at start, in the format
+    of the listings in asm/ so it can be assembled again. Instructions that
+    can't be reached are written as raw words with their bits drawn as a
+    sprite, and every address jumped to or called gets a label comment"""
+    if len(data) % 2:
+        data = bytes(data) + b"\0"
+    table = _asmTable
+    code, jumps, calls = find_code(data, start)
+
+    for offset in range(0, len(data), 2):
+        addr = start + offset
+        if addr in calls or addr in jumps:
+            if offset:
+                yield ""
+            kind = "sub" if addr in calls else "label"
+            yield f"# {kind}_{addr:03x}"
+
+        inst = (data[offset] << 8) + data[offset + 1]
+        if addr in code:
+            yield f"{hex(addr)}\t{table[inst] or asm_text(inst)}"
+        else:
+            rows = f"{SPRITE_ROWS[data[offset]]} {SPRITE_ROWS[data[offset + 1]]}"
+            yield f"{hex(addr)}\tERR: {hex(inst)} # {rows}"
+
+
+def decompile(infile, outfile):
+    """decompile a ch8 binary back into an assembly file"""
+    with open(infile, "rb") as inf:
+        data = inf.read()
 
-                memloc += 2
+    with open(outfile, "w") as outf:
+        outf.writelines(line + "\n" for line in disassemble(data))
 
 
 def main():
@@ -0,0 +1,63 @@
+def load_demo_3(chip):
+    """load a simple 'hello, world' style program for testing"""
+    # the following should write a "3" to the display
+    program = (
+        0x62,  # load the value 0 into register 2
+        0x00,
+        0x63,  # load the value 0 into register 3
+        0x00,
+        0x61,  # load the value 3 into register 1
+        0x03,
+        0xF1,  # load sprite for value of register 1 into I
+        0x29,
+        0xD2,  # write sprite to screen at coordinstes stored in 2 and 3
+        0x35,
+    )
+    chip.load_program(program)
+
+
+def load_demo_count(chip):
+    """load an counting program into the chip for testing the display"""
+    # the chip should count up from 0 to F, then reset
+    program = (
+        # program constants
+        0x62,  # load the value 0 into register 2
+        0x00,
+        0x63,  # load the value 0 into register 3
+        0x00,
+        # jump to execution
+        0x12,  # jump to 530 in memory (18 bytes ahead of the start)
+        0x14,
+        # subroutine to print the value in register 1 and increment it
+        0x00,  # clear display
+        0xE0,
+        0xF1,  # load sprite for value into I pointer
+        0x29,
+        0xD2,  # write sprite in I pointer to screen at constant coord
+        0x35,
+        0x71,  # add 1 to r1
+        0x01,
+        0x41,  # if our value isn't 16, skip to exit
+        0x10,
+        0x61,  # otherwise, reset to 0
+        0x00,
+        0x00,  # exit subroutine
+        0xEE,
+        # loop delay and redrawing
+        0x64,  # load 64 into register 4
+        0x40,
+        0xF4,  # load register 4 into DT (delay timer)
+        0x15,
+        # loop checking the value in the delay timer until it's 0
+        0xF5,  # load delay timer value into regiser 5
+        0x07,
+        0x35,  # if register 5 is 0, break the loop
+        0x00,
+        0x12,  # jump back to check delay timer again
+        0x18,
+        0x22,  # loop is broken, call the subroutine
+        0x06,
+        0x12,  # reset delay timer and reloop
+        0x14,
+    )
+    chip.load_program(program)
@@ -1,129 +1,29 @@
+import analyze8
+import asm8
 import chip8
+import demos8
+import headless8
+import hist8
+import jit8
+import keys8
+import prof8
+import sched8
+import stats8
+import trace8
 import tui8
 import argparse
 import curses
-import copy
-from collections import deque
-
-
-def load_demo_3(chip):
-    """load a simple 'hello, world' style program for testing"""
-    # the following should write a "3" to the display
-    program = (
-        0x62,  # load the value 0 into register 2
-        0x00,
-        0x63,  # load the value 0 into register 3
-        0x00,
-        0x61,  # load the value 3 into register 1
-        0x03,
-        0xF1,  # load sprite for value of register 1 into I
-        0x29,
-        0xD2,  # write sprite to screen at coordinstes stored in 2 and 3
-        0x35,
-    )
-    chip.load_program(program)
-
-
-def load_demo_count(chip):
-    """load an counting program into the chip for testing the display"""
-    # the chip should count up from 0 to F, then reset
-    program = (
-        # program constants
-        0x62,  # load the value 0 into register 2
-        0x00,
-        0x63,  # load the value 0 into register 3
-        0x00,
-        # jump to execution
-        0x12,  # jump to 530 in memory (18 bytes ahead of the start)
-        0x14,
-        # subroutine to print the value in register 1 and increment it
-        0x00,  # clear display
-        0xE0,
-        0xF1,  # load sprite for value into I pointer
-        0x29,
-        0xD2,  # write sprite in I pointer to screen at constant coord
-        0x35,
-        0x71,  # add 1 to r1
-        0x01,
-        0x41,  # if our value isn't 16, skip to exit
-        0x10,
-        0x61,  # otherwise, reset to 0
-        0x00,
-        0x00,  # exit subroutine
-        0xEE,
-        # loop delay and redrawing
-        0x64,  # load 64 into register 4
-        0x40,
-        0xF4,  # load register 4 into DT (delay timer)
-        0x15,
-        # loop checking the value in the delay timer until it's 0
-        0xF5,  # load delay timer value into regiser 5
-        0x07,
-        0x35,  # if register 5 is 0, break the loop
-        0x00,
-        0x12,  # jump back to check delay timer again
-        0x18,
-        0x22,  # loop is broken, call the subroutine
-        0x06,
-        0x12,  # reset delay timer and reloop
-        0x14,
-    )
-    chip.load_program(program)
+import threading
+import time
 
 
 def load_file(f, chip):
-    """read a raw program in from a file and load it into the chip"""
-
-    program = []
-    with open(f, "rb") as file:
-        for byteArray in file:
-            for byte in byteArray:
-                program.append(byte)
-
-    chip.load_program(program)
-
-
-def update_keys(chip, tui, currPress):
-    """set the chip's keys according to what's pressed on the keyboard"""
-    keys = (
-        "0",
-        "1",
-        "2",
-        "3",
-        "4",
-        "5",
-        "6",
-        "7",
-        "8",
-        "9",
-        "a",
-        "b",
-        "c",
-        "d",
-        "e",
-        "f",
-    )
-
-    press = tui.inputWin.getch()
-
-    # we account for a timeout becuase getch fails if it's called too quickly
-    if press == -1:
-        currPress[1] = currPress[1] - 1
-    elif currPress[0] == chr(press):
-        currPress[1] = 150
+    """read a raw program in from a file and load it into the chip,
+    assembling it first if it's a listing like the ones in asm/"""
+    if f.lower().endswith(".asm"):
+        chip.load_program(asm8.assemble_file(f))
     else:
-        currPress[0] = chr(press)
-        currPress[1] = 150
-
-    if currPress[1] == 0:
-        currPress[0] = ""
-
-    # update chip keys based on what's pressed
-    for i, key in enumerate(keys):
-        if key == currPress[0]:
-            chip.keys[i] = True
-        else:
-            chip.keys[i] = False
+        chip.load_rom(f)
 
 
 def update_keys_debug(chip, tui, press):
@@ -154,37 +54,72 @@ def update_keys_debug(chip, tui, press):
 
 
 def run_chip(chip, tui, refreshrate, stdscr):
-    """cycle the chip and update the display according to the refresh rate"""
-
-    currPress = ["", 0]  # initialize key press history to nothing
-
-    while chip.get_curr_inst() != chip8.Chip.EXIT:
-
-        screenUpdated = False
-        for _ in range(refreshrate):
-
-            # if we're going to write to the chip sceen, note it
-            inst = chip.get_curr_inst()
-            if inst >> 12 == 0xD:
-                screenUpdated = True
+    """run the chip in real time on its own thread and read keys on
+    another while this one draws the newest frame at a fixed rate set by
+    the refresh rate, so a slow terminal drops frames instead of slowing
+    the chip"""
+
+    # refresh rate is given in cycles, but there's nothing new to draw more
+    # often than once a frame
+    period = max(refreshrate, chip.clockSpeed / chip.TIMER_SPEED) / chip.clockSpeed
+
+    scheduler = sched8.Scheduler(chip)
+    framebuffer = sched8.FrameBuffer()
+    stop = threading.Event()
+    emulator = threading.Thread(
+        target=scheduler.run, args=(framebuffer, stop), daemon=True
+    )
+    emulator.start()
+    # keys read mid-frame wait for the next one so the trace sees them
+    # where the chip does
+    pending = None
+    if chip.recorder is not None:
+        pending = chip.recorder.pending = list(chip.keys)
+    keyboard = keys8.Keyboard(chip, keys=pending)
+    keyboard.start()
+
+    try:
+        deadline = time.monotonic()
+        keys = list(chip.keys)
+        while emulator.is_alive():
+
+            # if we're running the tui in fast mode,
+            # don't update it unless there's a new frame or key press
+            start = time.perf_counter()
+            frame = framebuffer.take()
+            if frame is not None:
+                tui.update(frame)
+            elif tui.compmode or chip.keys != keys:
+                # registers, memory and keys change without the display
+                tui.update(([], 0))
+            keys = list(chip.keys)
+            if chip.stats is not None:
+                chip.stats.add_time("render", time.perf_counter() - start)
+
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.monotonic()
+    finally:
+        keyboard.stop()
+        stop.set()
+        emulator.join()
 
-            # run the chip and check for input
-            update_keys(chip, tui, currPress)
-            chip.cycle()
+        if chip.stats is not None:
+            chip.stats.framesRendered = framebuffer.taken
+            chip.stats.framesDropped = framebuffer.dropped()
 
-        # if we're running the tui in fast mode,
-        # don't update it unless draw has been called
-        if not tui.compmode:
-            if screenUpdated:
-                tui.update()
-        else:
-            tui.update()
+    if scheduler.error is not None:
+        raise scheduler.error
 
 
-def run_debug(chip, tui, stdscr):
+def run_debug(chip, tui, rewind, stdscr):
     """cycle the chip and update the display only when space is pressed"""
 
-    states = deque()  # copies of the chip at previous states, this eats a ton of memory
+    history = hist8.History(chip, maxSteps=rewind)
+    # changes made by each of the last rewind steps
     while chip.get_curr_inst() != chip8.Chip.EXIT:
 
         press = tui.inputWin.getch()
@@ -192,22 +127,30 @@ def run_debug(chip, tui, stdscr):
 
             # step
             if press == ord(" "):
-                states.append(copy.deepcopy(chip))
                 chip.cycle()
+                history.record()
 
-            # go back
+            # go back, if there's nothing to go back to this does nothing
             elif press == ord("z"):
+                history.back()
+
+            # go to a cycle, anything that isn't one still in the history
+            # does nothing
+            elif press == ord("g"):
+                text = tui.prompt("go to cycle: ")
                 try:
-                    chip = states.pop()
-                    tui.chip = chip
-                except:  # if the states deque is empty, do nothing
+                    history.seek(int(text))
+                except ValueError:
                     pass
 
             # toggle chip keys
             else:
                 update_keys_debug(chip, tui, press)
 
+            start = time.perf_counter()
             tui.update()
+            if chip.stats is not None:
+                chip.stats.add_time("render", time.perf_counter() - start)
 
 
 def init_argparse():
@@ -242,42 +185,157 @@ def init_argparse():
         action="store_true",
         help="run in comprehensive windowed mode",
     )
+    parser.add_argument(
+        "-hb",
+        "--halfblock",
+        action="store_true",
+        help="draw two rows of pixels per line of text with half block characters",
+    )
     parser.add_argument("-db", "--debug", action="store_true", help="run in debug mode")
+    parser.add_argument(
+        "-rw",
+        "--rewind",
+        metavar="steps",
+        type=int,
+        default=1000000,
+        help="set the number of steps debug mode can go back (default 1000000)",
+    )
+    parser.add_argument(
+        "-t",
+        "--turbo",
+        action="store_true",
+        help="run as fast as possible without a display and report the speed",
+    )
+    parser.add_argument(
+        "-mc",
+        "--maxcycles",
+        metavar="cycles",
+        type=int,
+        help="stop after this many cycles in turbo or headless mode",
+    )
+    parser.add_argument(
+        "-hl",
+        "--headless",
+        action="store_true",
+        help="run as fast as possible without a display and print the final state",
+    )
+    parser.add_argument(
+        "-st",
+        "--stats",
+        metavar="file",
+        nargs="?",
+        const="-",
+        help="write counters for the run as JSON to a file, or stdout, on exit",
+    )
+    parser.add_argument(
+        "-jt",
+        "--jit",
+        action="store_true",
+        help="compile blocks of instructions to python as they're reached",
+    )
+    parser.add_argument(
+        "-pf",
+        "--profile",
+        metavar="file",
+        nargs="?",
+        const="-",
+        help="write the time spent at each address to a file, or stdout, on exit",
+    )
+    parser.add_argument(
+        "-sd",
+        "--seed",
+        metavar="n",
+        type=int,
+        help="seed the random numbers so runs can be repeated",
+    )
+    parser.add_argument(
+        "-rc",
+        "--record",
+        metavar="file",
+        help="record a trace of the run to a file for trace8.py to replay",
+    )
+    headless8.add_headless_args(parser)
 
     return parser
 
 
-def main(stdscr):
-    """run a program on the chip8 depending on specified arguments"""
-
-    # parse args
-    parser = init_argparse()
-    args = parser.parse_args()
-
-    chip = chip8.Chip()
+def init_chip(args):
+    """create a chip and load the program specified by the arguments"""
+    chip = chip8.Chip(args.seed)
 
     if args.run:
         load_file(args.run, chip)
-        chip.clockSpeed = args.clockspeed
     elif args.three:
-        load_demo_3(chip)
-        chip.clockSpeed = args.clockspeed
+        demos8.load_demo_3(chip)
     # count is the default
     else:
-        load_demo_count(chip)
-        chip.clockSpeed = args.clockspeed
+        demos8.load_demo_count(chip)
+
+    chip.clockSpeed = args.clockspeed
+    if args.record:
+        trace8.Recorder(chip)
+    if args.jit:
+        jit8.Translator(chip).precompile(analyze8.analyze_chip(chip))
+    if args.stats:
+        stats8.Stats(chip)
+    if args.profile:
+        prof8.Profiler(chip)
+    return chip
+
+
+def run_turbo(chip, maxcycles):
+    """run the chip unthrottled and print how fast it went"""
+    stats = chip.run_fast(maxcycles)
+    print(
+        f"ran {stats['cycles']} cycles in {stats['seconds']:.3f} seconds "
+        f"({stats['ips']:.0f} instructions per second)"
+    )
+
+
+def main(stdscr, args, chip):
+    """run a program on the chip8 in the terminal depending on specified
+    arguments"""
 
     curses.noecho()
     curses.cbreak()
 
-    tui = tui8.Tui(stdscr, chip, compmode=args.comprehensive)
+    tui = tui8.Tui(
+        stdscr, chip, compmode=args.comprehensive, halfblock=args.halfblock
+    )
     tui.inputWin.nodelay(1)
 
     if args.debug:
-        run_debug(chip, tui, stdscr)
+        run_debug(chip, tui, args.rewind, stdscr)
     else:
         run_chip(chip, tui, args.refreshrate, stdscr)
 
 
 if __name__ == "__main__":
-    curses.wrapper(main)
+    parser = init_argparse()
+    args = parser.parse_args()
+    # stepping back in debug mode can't be replayed
+    if args.record and args.debug:
+        parser.error("can't record a trace in debug mode")
+    chip = init_chip(args)
+
+    try:
+        if args.headless:
+            try:
+                keys = headless8.read_keys(args)
+            except ValueError as e:
+                parser.error(str(e))
+
+            result = headless8.run_headless(chip, args.maxcycles, keys)
+            headless8.write_result(result, args.output)
+        elif args.turbo:
+            run_turbo(chip, args.maxcycles)
+        else:
+            curses.wrapper(main, args, chip)
+    finally:
+        # runs in the terminal usually end with ctrl-c
+        if chip.stats is not None:
+            headless8.write_result(chip.stats.report(), args.stats)
+        if chip.profiler is not None:
+            prof8.write_report(chip.profiler, args.profile)
+        if chip.recorder is not None:
+            chip.recorder.save(args.record)
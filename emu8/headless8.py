@@ -0,0 +1,171 @@
+import chip8
+import argparse
+import json
+import sys
+
+
+def parse_keys(script):
+    """parse a key script into a sorted list of (cycle, key, pressed) events.
+    Events are separated by commas or new lines and written as cycle:key
+    followed by + for a press or - for a release, e.g. "120:5+, 300:5-".
+    Anything after a # on a line is ignored."""
+    events = []
+    for line in script.splitlines():
+        line = line.split("#")[0]
+        for event in line.split(","):
+            event = event.strip()
+            if not event:
+                continue
+
+            try:
+                cycle, key = event[:-1].split(":")
+                if event[-1] not in "+-":
+                    raise ValueError
+                key = int(key, 16)
+                if not 0 <= key <= 0xF:
+                    raise ValueError
+                events.append((int(cycle, 0), key, event[-1] == "+"))
+            except ValueError:
+                raise ValueError(f"bad key event: {event}") from None
+
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def run_headless(chip, max_cycles=None, keys=()):
+    """run a chip as fast as possible with no display until the program exits
+    or max_cycles instructions have run. keys is a list of (cycle, key,
+    pressed) events, each applied at the first frame starting on or after
+    its cycle. Returns the final state of the chip and timing stats."""
+    events = list(keys)
+    nextEvent = 0
+
+    def apply_keys():
+        nonlocal nextEvent
+        while nextEvent < len(events) and events[nextEvent][0] <= chip.cycleCount:
+            _, key, pressed = events[nextEvent]
+            chip.keys[key] = pressed
+            nextEvent += 1
+
+    stats = chip.run_fast(max_cycles, before_frame=apply_keys if events else None)
+    return chip_result(chip, stats)
+
+
+def chip_result(chip, stats):
+    """return the state of a chip after a run along with the run's stats"""
+    return {
+        "exited": chip.get_curr_inst() == chip8.Chip.EXIT,
+        "cycles": stats["cycles"],
+        "seconds": stats["seconds"],
+        "ips": stats["ips"],
+        "pc": chip.pc,
+        "I": chip.regI,
+        "regs": [int(reg) for reg in chip.regs],
+        "sp": chip.sp,
+        "stack": list(chip.stack),
+        "dt": chip.dt,
+        "st": chip.st,
+        "display": display_lines(chip),
+    }
+
+
+def display_lines(chip):
+    """return the chip display as strings of # for set pixels and . for
+    clear ones, top row first"""
+    width = chip8.Chip.DISPLAY_X_MAX + 1
+    return [
+        format(row, f"0{width}b").replace("0", ".").replace("1", "#")
+        for row in chip.disp
+    ]
+
+
+def write_result(result, outfile=None):
+    """write the result of a run as JSON to a file or stdout"""
+    text = json.dumps(result, indent=2) + "\n"
+    if outfile is None or outfile == "-":
+        sys.stdout.write(text)
+    else:
+        with open(outfile, "w") as outf:
+            outf.write(text)
+
+
+def read_keys(args):
+    """return the key events given on the command line"""
+    script = args.keys or ""
+    if args.keyfile:
+        with open(args.keyfile) as keyfile:
+            script += "\n" + keyfile.read()
+    return parse_keys(script)
+
+
+def add_headless_args(parser):
+    """add the options for headless runs to an argument parser"""
+    parser.add_argument(
+        "-k",
+        "--keys",
+        metavar="events",
+        help='key presses and releases for a headless run, e.g. "120:5+,300:5-"',
+    )
+    parser.add_argument(
+        "-kf", "--keyfile", metavar="file", help="read key events from a file"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="file",
+        help="write the result of a headless run to a file instead of stdout",
+    )
+
+
+def init_argparse():
+    """create an argument parser"""
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [OPTION] FILE",
+        description="Run a chip8 program without a display and print its final state.",
+    )
+    parser.add_argument("rom", metavar="FILE", help="the program to run")
+    parser.add_argument(
+        "-cs",
+        "--clockspeed",
+        metavar="Hz",
+        type=int,
+        default=chip8.Chip.CLOCK_SPEED,
+        help="set the emulated clock speed in Hz, used to time the timers (default 500)",
+    )
+    parser.add_argument(
+        "-mc",
+        "--maxcycles",
+        metavar="cycles",
+        type=int,
+        help="stop after this many cycles",
+    )
+    parser.add_argument(
+        "-sd",
+        "--seed",
+        metavar="n",
+        type=int,
+        help="seed the random numbers so runs can be repeated",
+    )
+    add_headless_args(parser)
+    return parser
+
+
+def main():
+    parser = init_argparse()
+    args = parser.parse_args()
+
+    try:
+        keys = read_keys(args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    chip = chip8.Chip(args.seed)
+    chip.load_rom(args.rom)
+    chip.clockSpeed = args.clockspeed
+
+    result = run_headless(chip, args.maxcycles, keys)
+    write_result(result, args.output)
+
+
+if __name__ == "__main__":
+    main()
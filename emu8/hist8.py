@@ -0,0 +1,196 @@
+import chip8
+import struct
+from collections import deque
+
+# byte ranges of a chip snapshot that are checked for changes after each
+# step, as (start, end, chunk size). Memory and the display are compared
+# in chunks so unchanged ones are skipped without looking at each byte
+MEM_END = chip8.Chip.RAM_SIZE
+DISP_START = MEM_END + 16
+KEYS_START = DISP_START + 8 * (chip8.Chip.DISPLAY_Y_MAX + 1)
+CYCLE_START = chip8.SNAPSHOT.size - 8
+REGIONS = (
+    (0, MEM_END, 64),
+    (MEM_END, DISP_START, 16),
+    (DISP_START, KEYS_START, 8),
+    (KEYS_START, CYCLE_START, 16),
+)
+
+RUN_HEADER = struct.Struct("<HB")
+# offset and length of a run of changed bytes in a delta
+
+MAX_GAP = RUN_HEADER.size
+# unchanged bytes we'll include in a run rather than starting a new one
+
+
+class HistoryBlock:
+    """a full snapshot of a chip and the deltas for the steps after it"""
+
+    def __init__(self, cycle, keyframe):
+        self.cycle = cycle
+        # cycle count at the keyframe
+        self.keyframe = keyframe
+        # full snapshot of the chip at that cycle
+        self.deltas = bytearray()
+        # the changes made by each step, one after another
+        self.steps = 0
+        # number of steps recorded in deltas
+
+
+class History:
+    """record every step of a chip so that any earlier cycle can be
+    returned to. Each step is stored as only the bytes it changed, with a
+    full keyframe every interval steps to replay from, so a step usually
+    costs around ten bytes."""
+
+    INTERVAL = 2048
+    # steps between keyframes
+
+    def __init__(self, chip, maxSteps=None, interval=INTERVAL):
+        self.chip = chip
+        self.maxSteps = maxSteps
+        # the most steps to keep, oldest are dropped first
+        self.interval = interval
+
+        self.last = chip.snapshot()
+        # snapshot after the most recent step
+        self.blocks = deque([HistoryBlock(chip.cycleCount, self.last)])
+        self.steps = 0
+        # number of steps across all blocks
+
+    def __len__(self):
+        """return the number of steps that can be gone back"""
+        return self.steps
+
+    def first_cycle(self):
+        """return the earliest cycle that can be returned to"""
+        return self.blocks[0].cycle
+
+    def last_cycle(self):
+        """return the cycle of the most recent step"""
+        block = self.blocks[-1]
+        return block.cycle + block.steps
+
+    def record(self):
+        """record the changes to the chip since the last call. This should
+        be called after every instruction run on the chip"""
+        snap = self.chip.snapshot()
+
+        block = self.blocks[-1]
+        if block.steps == self.interval:
+            block = HistoryBlock(block.cycle + block.steps, self.last)
+            self.blocks.append(block)
+
+        History.diff(self.last, snap, block.deltas)
+        block.steps += 1
+        self.steps += 1
+        self.last = snap
+
+        # forget the oldest block once we have enough steps without it
+        if self.maxSteps is not None and len(self.blocks) > 1:
+            if self.steps - self.blocks[0].steps >= self.maxSteps:
+                self.steps -= self.blocks.popleft().steps
+
+    def back(self):
+        """return the chip to the state before the most recent step and
+        forget that step. Returns False if there's nothing to go back to"""
+        if self.last_cycle() == self.first_cycle():
+            return False
+
+        self.seek(self.last_cycle() - 1)
+        return True
+
+    def seek(self, cycle):
+        """return the chip to the state it was in at a given cycle and forget
+        every step after it"""
+        if not self.first_cycle() <= cycle <= self.last_cycle():
+            raise ValueError(
+                f"cycle {cycle} is outside of history "
+                f"({self.first_cycle()} - {self.last_cycle()})"
+            )
+
+        # drop the blocks after the one holding the cycle
+        while self.blocks[-1].cycle > cycle:
+            self.steps -= self.blocks.pop().steps
+        block = self.blocks[-1]
+
+        # replay from the keyframe and cut off the remaining deltas
+        state = bytearray(block.keyframe)
+        steps = cycle - block.cycle
+        end = History.replay(state, block.deltas, steps)
+        del block.deltas[end:]
+        self.steps -= block.steps - steps
+        block.steps = steps
+
+        struct.pack_into("<Q", state, CYCLE_START, cycle)
+        self.last = bytes(state)
+        self.chip.restore(self.last)
+
+    def state_at(self, cycle):
+        """return a snapshot of the chip at a given cycle without changing
+        the chip or the history"""
+        if not self.first_cycle() <= cycle <= self.last_cycle():
+            raise ValueError(f"cycle {cycle} is outside of history")
+
+        for block in reversed(self.blocks):
+            if block.cycle <= cycle:
+                break
+
+        state = bytearray(block.keyframe)
+        History.replay(state, block.deltas, cycle - block.cycle)
+        struct.pack_into("<Q", state, CYCLE_START, cycle)
+        return bytes(state)
+
+    @staticmethod
+    def diff(old, new, out):
+        """append the runs of bytes that differ between two snapshots to out,
+        preceded by the number of runs. The cycle count is left out since it
+        always goes up by one"""
+        runs = bytearray()
+        count = 0
+
+        for start, end, size in REGIONS:
+            if old[start:end] == new[start:end]:
+                continue
+
+            for chunk in range(start, end, size):
+                chunkEnd = min(chunk + size, end)
+                if old[chunk:chunkEnd] == new[chunk:chunkEnd]:
+                    continue
+
+                i = chunk
+                while i < chunkEnd:
+                    if old[i] == new[i]:
+                        i += 1
+                        continue
+
+                    # extend the run over any short gaps of unchanged bytes
+                    last = i
+                    j = i + 1
+                    while j < chunkEnd and j - last <= MAX_GAP:
+                        if old[j] != new[j]:
+                            last = j
+                        j += 1
+
+                    runs += RUN_HEADER.pack(i, last + 1 - i)
+                    runs += new[i : last + 1]
+                    count += 1
+                    i = last + 1
+
+        out.append(count)
+        out += runs
+
+    @staticmethod
+    def replay(state, deltas, steps):
+        """apply the first steps deltas to a snapshot in place. Returns the
+        position in deltas after the last one applied"""
+        pos = 0
+        for _ in range(steps):
+            count = deltas[pos]
+            pos += 1
+            for _ in range(count):
+                offset, length = RUN_HEADER.unpack_from(deltas, pos)
+                pos += RUN_HEADER.size
+                state[offset : offset + length] = deltas[pos : pos + length]
+                pos += length
+        return pos
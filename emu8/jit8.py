@@ -0,0 +1,267 @@
+import chip8
+from collections import OrderedDict
+
+# python source for the instructions a block runs inline, by handler name.
+# r is the chip's register list and each line keeps the exact order of
+# reads and writes of the handler it replaces, so vF comes out the same
+# when it's also an operand
+INLINE = {
+    "LDval": "r[{x}] = {kk}",
+    "ADDval": "r[{x}] = (r[{x}] + {kk}) & 255",
+    "LDreg": "r[{x}] = r[{y}]",
+    "OR": "r[{x}] = r[{x}] | r[{y}]",
+    "AND": "r[{x}] = r[{x}] & r[{y}]",
+    "XOR": "r[{x}] = r[{x}] ^ r[{y}]",
+    "ADDreg": "t = r[{x}] + r[{y}]\nr[{x}] = t & 255\nr[15] = t >> 8",
+    "SUB": "r[15] = 1 if r[{x}] > r[{y}] else 0\nr[{x}] = (r[{x}] - r[{y}]) & 255",
+    "SHR": "r[15] = r[{x}] % 2\nr[{x}] = r[{x}] // 2",
+    "SUBN": "r[15] = r[{y}] > r[{x}]\nr[{x}] = (r[{y}] - r[{x}]) & 255",
+    "SHL": "r[15] = r[{x}] > 127\nr[{x}] = (r[{x}] * 2) & 255",
+    "LDI": "chip.regI = {nnn}",
+    "ADDi": "chip.regI = (chip.regI + r[{x}]) & 0xFFF",
+    "LDdigit": "chip.regI = {digits} + 5 * r[{x}]",
+    "LDregdt": "r[{x}] = chip.dt",
+    "LDdt": "chip.dt = r[{x}]",
+    "LDst": "chip.st = r[{x}]",
+    "RND": "chip.RND({x}, {kk})",
+    "LDregmem": "chip.pc = {pc}\nchip.LDregmem({x})",
+    "CLS": "chip.pc = {pc}\nchip.CLS()",
+    "DRW": "chip.pc = {pc}\nchip.DRW({x}, {y}, {n})",
+}
+
+# python source for the instructions that end a block by setting the
+# program counter. Any other instruction that ends a block is run by
+# calling its handler
+BRANCHES = {
+    "JP": "chip.pc = {nnn}",
+    "SEval": "chip.pc = {skip} if r[{x}] == {kk} else {next}",
+    "SNEval": "chip.pc = {skip} if r[{x}] != {kk} else {next}",
+    "SEreg": "chip.pc = {skip} if r[{x}] == r[{y}] else {next}",
+    "SNEreg": "chip.pc = {skip} if r[{x}] != r[{y}] else {next}",
+}
+
+
+SHARED_PROGRAMS = 16
+# programs whose blocks are kept for later translators, dropping the least
+# recently used
+_precompiled = OrderedDict()
+# blocks compiled by Translator.precompile, by the hash of the program they
+# were compiled from, oldest first
+
+
+class Block:
+    """a run of instructions compiled to a single python function"""
+
+    def __init__(self, start, end, insts, run, waits):
+        self.start = start
+        # address of the first instruction
+        self.end = end
+        # address after the last instruction
+        self.insts = insts
+        # the instructions in the block, for counting them
+        self.length = len(insts)
+        # number of instructions in the block
+        self.run = run
+        # function running the block on a chip
+        self.waits = waits
+        # whether the block starts with an instruction that can be part of
+        # an idle loop for Chip.idle_cycles
+
+
+class Translator:
+    """run a chip by compiling each straight line run of its instructions
+    into a python function the first time it's reached. Blocks end at the
+    first instruction that can jump, wait or write to memory, and are thrown
+    away when the memory they were compiled from changes."""
+
+    MAX_BLOCK = 64
+    # the most instructions in one block
+
+    def __init__(self, chip):
+        self.chip = chip
+        self.blocks = {}
+        # compiled blocks by start address
+        self.tails = {}
+        # blocks cut short to fit the end of a frame, by start address and
+        # length
+        self.code = bytearray(chip8.Chip.RAM_SIZE)
+        # set for each memory address that some block was compiled from
+        self.compiled = 0
+        # number of blocks compiled, including ones thrown away
+        self.shared = None
+        # blocks kept for other translators running the same program, by
+        # start address, or start address and length for tails. Set by
+        # precompile
+        self.written = bytearray(chip8.Chip.RAM_SIZE)
+        # set for each memory address written since the translator was
+        # attached, which blocks can't be shared from
+        chip.translator = self
+
+    def run_cycles(self, n):
+        """run up to n instructions back to back, as Chip.run_cycles does.
+        Returns the number of instructions run."""
+        chip = self.chip
+        blocks = self.blocks
+        counts = None if chip.stats is None else chip.stats.opcodes
+        ran = 0
+
+        while ran < n:
+            pc = chip.pc
+            block = blocks.get(pc)
+            if block is None:
+                block = self.compile(pc)
+
+            # let the interpreter stop on an exit or raise on a bad
+            # instruction
+            if block is None:
+                return ran + chip.interpret(n - ran)
+
+            if block.waits:
+                idle = chip.idle_cycles(n - ran)
+                if idle:
+                    chip.cycleCount += idle
+                    ran += idle
+                    continue
+
+            # run a shorter block if the whole one doesn't fit in what's left
+            if block.length > n - ran:
+                key = (pc, n - ran)
+                block = self.tails.get(key)
+                if block is None:
+                    block = self.compile(pc, n - ran)
+                    self.tails[key] = block
+
+            try:
+                block.run(chip)
+            except Exception:
+                # anything that can raise sets the program counter first,
+                # so everything before it has finished
+                chip.cycleCount += (chip.pc - pc) // 2
+                raise
+            chip.cycleCount += block.length
+            ran += block.length
+
+            if counts is not None:
+                for inst in block.insts:
+                    counts[inst] += 1
+
+        return ran
+
+    def compile(self, start, limit=MAX_BLOCK):
+        """compile the block of up to limit instructions starting at a given
+        address. Returns None if there's nothing to compile there"""
+        chip = self.chip
+        mem = chip.mem
+        table = chip.decodeTable
+        lines = []
+        insts = []
+        pc = start
+        length = 0
+        branched = False
+
+        while length < limit and pc + 1 < chip8.Chip.RAM_SIZE:
+            inst = (mem[pc] << 8) + mem[pc + 1]
+            op = None if inst == chip8.Chip.EXIT else table[inst]
+            if op is None:
+                break
+
+            _, operands, name, layout = op
+            fields = dict(zip(chip8.LAYOUTS[layout], operands))
+            fields.update(
+                pc=pc, next=pc + 2, skip=pc + 4, digits=chip8.Chip.DIGIT_MEM_INDEX
+            )
+            insts.append(inst)
+            length += 1
+            pc += 2
+
+            if name in INLINE:
+                lines.append(INLINE[name].format(**fields))
+                continue
+
+            if name in BRANCHES:
+                lines.append(BRANCHES[name].format(**fields))
+            else:
+                args = ", ".join(str(operand) for operand in operands)
+                lines.append(f"chip.pc = {fields['pc']}\nchip.{name}({args})")
+            branched = True
+            break
+
+        if length == 0:
+            return None
+        if not branched:
+            lines.append(f"chip.pc = {pc}")
+
+        source = "def run(chip):\n    r = chip.regs\n"
+        for line in "\n".join(lines).split("\n"):
+            source += f"    {line}\n"
+        namespace = {}
+        exec(compile(source, f"<block {start:#05x}>", "exec"), namespace)
+
+        waits = chip8.WAITS[(mem[start] << 8) + mem[start + 1]]
+        block = Block(start, pc, tuple(insts), namespace["run"], bool(waits))
+        if limit == Translator.MAX_BLOCK:
+            self.blocks[start] = block
+        self.code[start:pc] = b"\x01" * (pc - start)
+        self.compiled += 1
+
+        # a block compiled from memory as it was loaded is the same for any
+        # chip running the program
+        if self.shared is not None and self.written.find(1, start, pc) == -1:
+            key = start if limit == Translator.MAX_BLOCK else (start, limit)
+            self.shared[key] = block
+        return block
+
+    def precompile(self, analysis):
+        """compile every block the program can reach up front, from an
+        analyze8.Analysis of it as it was loaded, so running it doesn't stop
+        to compile or check instructions anywhere the analysis reached.
+        These and any blocks compiled later from memory the program hasn't
+        written to are kept and shared with translators running the same
+        program later. Has to be called before the program runs"""
+        blocks = _precompiled.pop(analysis.digest, None)
+        if blocks is None:
+            blocks = {}
+        _precompiled[analysis.digest] = self.shared = blocks
+        while len(_precompiled) > SHARED_PROGRAMS:
+            _precompiled.popitem(last=False)
+
+        if blocks:
+            for key, block in blocks.items():
+                if isinstance(key, tuple):
+                    self.tails[key] = block
+                else:
+                    self.blocks[key] = block
+                self.code[block.start : block.end] = b"\x01" * (
+                    block.end - block.start
+                )
+            return
+
+        # blocks end wherever the graph's runs do and at more places besides,
+        # so carry on from the end of each one
+        todo = sorted(analysis.blocks)
+        while todo:
+            start = todo.pop()
+            if start in self.blocks or start not in analysis.code:
+                continue
+            block = self.compile(start)
+            if block is not None:
+                todo.append(block.end)
+
+    def invalidate(self, start, end):
+        """throw away every block compiled from memory between start and
+        end, called whenever the chip writes to memory"""
+        self.written[start:end] = b"\x01" * (min(end, len(self.written)) - start)
+        if self.code.find(1, start, end) == -1:
+            return
+
+        for blocks in (self.blocks, self.tails):
+            for key, block in list(blocks.items()):
+                if block.start < end and start < block.end:
+                    del blocks[key]
+
+        self.code[:] = bytes(len(self.code))
+        for blocks in (self.blocks, self.tails):
+            for block in blocks.values():
+                self.code[block.start : block.end] = b"\x01" * (
+                    block.end - block.start
+                )
@@ -0,0 +1,141 @@
+import os
+import re
+import selectors
+import threading
+import time
+from collections import deque
+
+KEY_CHARS = "0123456789abcdef"
+# characters for each chip key, in key order
+
+ESCAPE = re.compile("\x1b(?:[\\[O][\x20-\x3f]*)?[\x40-\x7e]?")
+# the sequences terminals send for arrows and function keys: an escape, an
+# optional [ or O with any parameters, then a final character
+
+
+class Keyboard:
+    """read key presses from a terminal on a background thread and keep the
+    chip's keys set to match. Terminals only report presses, repeating them
+    while a key is held, so a key is released once the repeats stop: after
+    REPEAT_DELAY if it was only reported once, or REPEAT_GAP after its last
+    repeat. Each key is tracked on its own, so several can be down at once."""
+
+    REPEAT_DELAY = 0.6
+    # seconds a key stays down after its first report, long enough for the
+    # terminal to start repeating it
+    REPEAT_GAP = 0.15
+    # seconds a key stays down after each repeat
+    MAX_EVENTS = 1024
+    # presses and releases kept in events
+
+    def __init__(self, chip, fd=0, keys=None):
+        self.chip = chip
+        self.fd = fd
+        # file descriptor to read key presses from
+        self.keys = chip.keys if keys is None else keys
+        # key states to keep up to date, the chip's own unless something
+        # else decides when the chip sees them
+
+        self.pressedAt = [None] * len(KEY_CHARS)
+        # time each key went down, None while it's up
+        self.lastSeen = [0.0] * len(KEY_CHARS)
+        # time each key was last reported
+        self.repeats = [0] * len(KEY_CHARS)
+        # times each key was reported since it went down
+        self.events = deque(maxlen=Keyboard.MAX_EVENTS)
+        # the latest (time, key, pressed) changes, oldest first
+
+        self.thread = None
+        self.wakeRead, self.wakeWrite = None, None
+        # pipe used to stop the thread while it's waiting
+
+    def start(self):
+        """start reading keys on a background thread"""
+        self.wakeRead, self.wakeWrite = os.pipe()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """stop the background thread and release every key"""
+        if self.thread is None:
+            return
+
+        os.write(self.wakeWrite, b"\0")
+        self.thread.join()
+        os.close(self.wakeRead)
+        os.close(self.wakeWrite)
+        self.thread = None
+
+        self.expire(float("inf"))
+
+    def run(self):
+        """read and apply key presses until stopped, releasing keys as their
+        repeats run out"""
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.fd, selectors.EVENT_READ)
+            selector.register(self.wakeRead, selectors.EVENT_READ)
+
+            nextRelease = None
+            while True:
+                timeout = None
+                if nextRelease is not None:
+                    timeout = max(0, nextRelease - time.monotonic())
+
+                ready = selector.select(timeout)
+                start = time.perf_counter()
+
+                for key, _ in ready:
+                    if key.fd == self.wakeRead:
+                        return
+
+                    data = os.read(self.fd, 64)
+                    if not data:
+                        return
+                    self.feed(data, time.monotonic())
+
+                nextRelease = self.expire(time.monotonic())
+                if self.chip.stats is not None:
+                    self.chip.stats.add_time("input", time.perf_counter() - start)
+
+    def feed(self, data, now):
+        """apply the key presses in bytes read from the terminal at a given
+        time, skipping any escape sequences in among them"""
+        text = ESCAPE.sub("", data.decode("latin-1"))
+
+        for char in text:
+            key = KEY_CHARS.find(char)
+            if key == -1:
+                continue
+
+            if self.pressedAt[key] is None:
+                self.pressedAt[key] = now
+                self.repeats[key] = 0
+                self.keys[key] = True
+                self.events.append((now, key, True))
+            else:
+                self.repeats[key] += 1
+            self.lastSeen[key] = now
+
+    def expire(self, now):
+        """release every key whose repeats have stopped by a given time.
+        Returns when the next held key will be released if it isn't
+        reported again, or None if no keys are down"""
+        nextRelease = None
+
+        for key, pressedAt in enumerate(self.pressedAt):
+            if pressedAt is None:
+                continue
+
+            if self.repeats[key]:
+                release = self.lastSeen[key] + Keyboard.REPEAT_GAP
+            else:
+                release = self.lastSeen[key] + Keyboard.REPEAT_DELAY
+
+            if release <= now:
+                self.pressedAt[key] = None
+                self.keys[key] = False
+                self.events.append((now, key, False))
+            elif nextRelease is None or release < nextRelease:
+                nextRelease = release
+
+        return nextRelease
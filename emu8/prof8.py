@@ -0,0 +1,158 @@
+import chip8
+import debug8
+import sys
+import time
+
+
+class Profiler:
+    """count how many times each instruction runs and the host time it takes,
+    by address and by opcode, to find the loops in a rom worth optimising and
+    the handlers worth speeding up. While attached the chip runs through the
+    profiler's own loop in place of the interpreter or translator, so a chip
+    without one pays nothing for it. Cycles skipped in idle loops aren't
+    run, so they aren't counted."""
+
+    def __init__(self, chip):
+        self.chip = chip
+
+        self.addrCounts = [0] * chip8.Chip.RAM_SIZE
+        # times the instruction at each address was run
+        self.addrTimes = [0.0] * chip8.Chip.RAM_SIZE
+        # seconds spent running the instruction at each address
+        self.addrInsts = [None] * chip8.Chip.RAM_SIZE
+        # last instruction run from each address, which can change if the
+        # program writes over itself
+        self.instCounts = [0] * 0x10000
+        # times each instruction was run
+        self.instTimes = [0.0] * 0x10000
+        # seconds spent running each instruction
+
+        chip.profiler = self
+
+    def run_cycles(self, n):
+        """run up to n instructions back to back, as Chip.interpret does,
+        timing each one. Returns the number of instructions run."""
+        chip = self.chip
+        mem = chip.mem
+        table = chip.decodeTable
+        waits = chip8.WAITS
+        clock = time.perf_counter
+        addrCounts, addrTimes, addrInsts = (
+            self.addrCounts,
+            self.addrTimes,
+            self.addrInsts,
+        )
+        instCounts, instTimes = self.instCounts, self.instTimes
+        counts = None if chip.stats is None else chip.stats.opcodes
+        ran = 0
+
+        try:
+            while ran < n:
+                pc = chip.pc
+                inst = (mem[pc] << 8) + mem[pc + 1]
+                if inst == chip8.Chip.EXIT:
+                    break
+
+                if waits[inst]:
+                    idle = chip.idle_cycles(n - ran)
+                    if idle:
+                        ran += idle
+                        continue
+
+                op = table[inst]
+                if op is None:
+                    raise (Exception(f"Bad instruction: {inst}"))
+
+                start = clock()
+                op[0](chip, *op[1])
+                elapsed = clock() - start
+
+                addrCounts[pc] += 1
+                addrTimes[pc] += elapsed
+                addrInsts[pc] = inst
+                instCounts[inst] += 1
+                instTimes[inst] += elapsed
+                if counts is not None:
+                    counts[inst] += 1
+                ran += 1
+        finally:
+            chip.cycleCount += ran
+
+        return ran
+
+    def execute(self, inst):
+        """execute a single instruction on the chip as Chip.execute does,
+        timing it"""
+        chip = self.chip
+        pc = chip.pc
+
+        start = time.perf_counter()
+        chip.execute(inst)
+        elapsed = time.perf_counter() - start
+
+        if inst != chip8.Chip.EXIT:
+            self.addrCounts[pc] += 1
+            self.addrTimes[pc] += elapsed
+            self.addrInsts[pc] = inst
+            self.instCounts[inst] += 1
+            self.instTimes[inst] += elapsed
+
+    def hot_spots(self):
+        """return the address, instruction, run count and seconds of every
+        address that was run, most time first"""
+        spots = [
+            (addr, self.addrInsts[addr], count, self.addrTimes[addr])
+            for addr, count in enumerate(self.addrCounts)
+            if count
+        ]
+        return sorted(spots, key=lambda spot: -spot[3])
+
+    def handlers(self):
+        """return the run count and seconds of each instruction handler by
+        name, most time first"""
+        table = chip8.decode_table()
+        totals = {}
+        for inst, count in enumerate(self.instCounts):
+            if count:
+                name = table[inst][2]
+                runs, seconds = totals.get(name, (0, 0.0))
+                totals[name] = (runs + count, seconds + self.instTimes[inst])
+
+        return dict(sorted(totals.items(), key=lambda item: -item[1][1]))
+
+    def report(self, limit=None):
+        """return the profile as text in the style of the listings in asm/:
+        the hottest addresses with their assembly, then a summary of each
+        handler as comments. Only the first limit addresses are listed if
+        it's given"""
+        spots = self.hot_spots()
+        runs = sum(spot[2] for spot in spots)
+        total = sum(spot[3] for spot in spots)
+
+        lines = [f"# {runs} instructions in {total * 1000:.3f} ms of host time"]
+        for addr, inst, count, seconds in spots[:limit]:
+            share = seconds / total * 100 if total else 0.0
+            lines.append(
+                f"{hex(addr)}\t{debug8.inst_to_asm(inst)} # {count} runs, "
+                f"{seconds * 1000:.3f} ms, {share:.1f}%"
+            )
+
+        lines.append("")
+        lines.append("# handler\truns\tms\tus per run")
+        for name, (count, seconds) in self.handlers().items():
+            lines.append(
+                f"# {name}\t{count}\t{seconds * 1000:.3f}\t"
+                f"{seconds / count * 1e6:.2f}"
+            )
+
+        return "\n".join(lines) + "\n"
+
+
+def write_report(profiler, outfile=None, limit=None):
+    """write a profiler's report to a file or stdout"""
+    text = profiler.report(limit)
+    if outfile is None or outfile == "-":
+        sys.stdout.write(text)
+    else:
+        with open(outfile, "w") as outf:
+            outf.write(text)
@@ -0,0 +1,130 @@
+import chip8
+import threading
+import time
+
+
+class Scheduler:
+    """run a chip one 60Hz frame at a time. Each frame runs a frame's worth
+    of instructions back to back, counts the timers down once, then sleeps
+    until the frame's deadline on the monotonic clock. Deadlines are
+    absolute so a frame that runs late is made up by the ones after it."""
+
+    MAX_LAG = 6
+    # frames we can fall behind by before giving up on catching up
+
+    def __init__(self, chip):
+        self.chip = chip
+        self.frameCount = 0
+        # number of frames run so far
+        self.lateFrames = 0
+        # number of frames that finished after their deadline
+        self.error = None
+        # exception that stopped run, if any
+
+    def run_frame(self):
+        """run a single frame on the chip without waiting. Returns the number
+        of instructions run."""
+        if self.chip.recorder is not None:
+            self.chip.recorder.sync()
+        ran = self.chip.run_frame(self.chip.frame_cycles(self.frameCount))
+        self.frameCount += 1
+        return ran
+
+    def frames(self):
+        """run frames in real time until the program exits, yielding after
+        each one so the caller can draw the screen and read input before
+        the wait for the next frame"""
+        period = 1 / chip8.Chip.TIMER_SPEED
+        deadline = time.monotonic()
+        stats = self.chip.stats
+
+        while self.chip.get_curr_inst() != chip8.Chip.EXIT:
+            start = time.perf_counter()
+            self.run_frame()
+            if stats is not None:
+                stats.add_time("execute", time.perf_counter() - start)
+            yield self.frameCount
+
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+                if stats is not None:
+                    stats.add_time("sleep", delay)
+            else:
+                self.lateFrames += 1
+                if stats is not None:
+                    stats.lateFrames += 1
+
+                # if we're too far behind (e.g. the process was suspended),
+                # start over from now rather than racing to catch up
+                if -delay > Scheduler.MAX_LAG * period:
+                    deadline = time.monotonic()
+
+    def run(self, framebuffer, stop):
+        """run frames in real time until the program exits or stop is set,
+        publishing the display to framebuffer after each one. This is meant
+        to run on its own thread, so anything raised is kept in error for
+        the thread that started it."""
+        try:
+            for _ in self.frames():
+                framebuffer.publish(self.chip)
+                if stop.is_set():
+                    break
+        except Exception as e:
+            self.error = e
+
+
+class FrameBuffer:
+    """pass finished frames of the display from the emulation thread to the
+    render thread. The emulation thread copies a frame into the back buffer
+    then swaps it to the front, and the render thread copies out the front,
+    so a frame is never seen half drawn. Frames published before the last
+    one was taken replace it and are dropped."""
+
+    def __init__(self):
+        self.front = [0] * (chip8.Chip.DISPLAY_Y_MAX + 1)
+        # the newest frame, only touched with the lock held
+        self.back = [0] * (chip8.Chip.DISPLAY_Y_MAX + 1)
+        # the frame being copied from the chip
+        self.dirty = 0
+        # rows changed by the frames published since the last take
+        self.fresh = False
+        # whether a frame was published since the last take
+        self.published = 0
+        # number of frames published
+        self.taken = 0
+        # number of frames taken to be shown
+        self.lock = threading.Lock()
+
+    def publish(self, chip):
+        """copy the chip's display to the front if it changed since the
+        last publish"""
+        dirty = chip.take_dirty_rows()
+        if not dirty:
+            return
+
+        self.back[:] = chip.disp
+        with self.lock:
+            self.front, self.back = self.back, self.front
+            self.dirty |= dirty
+            self.fresh = True
+            self.published += 1
+
+    def take(self):
+        """return a copy of the newest frame and the mask of rows changed
+        since the last take, or None if no frame was published since then"""
+        with self.lock:
+            if not self.fresh:
+                return None
+
+            rows = list(self.front)
+            dirty = self.dirty
+            self.dirty = 0
+            self.fresh = False
+            self.taken += 1
+        return rows, dirty
+
+    def dropped(self):
+        """return the number of frames replaced before they were shown"""
+        return self.published - self.taken
@@ -0,0 +1,82 @@
+import chip8
+import time
+
+
+class Stats:
+    """counters for where a chip's instructions and time go, for spotting
+    regressions and sizing hosts. The chip only counts instructions and
+    draws while it has stats attached, and the runners add the time they
+    spend in each part of a run."""
+
+    TIMES = ("execute", "sleep", "render", "input")
+    # parts of a run that time is counted for
+
+    def __init__(self, chip):
+        self.chip = chip
+
+        self.opcodes = [0] * 0x10000
+        # times each instruction was run
+        self.idleCycles = 0
+        # cycles skipped in loops waiting on the delay timer or a key
+        self.sprites = 0
+        # number of sprites drawn
+        self.clears = 0
+        # number of times the display was cleared
+        self.pixels = 0
+        # pixels flipped by sprites
+
+        self.times = dict.fromkeys(Stats.TIMES, 0.0)
+        # seconds spent in each part of a run
+        self.framesRendered = 0
+        # frames drawn to the terminal
+        self.framesDropped = 0
+        # frames replaced by newer ones before they could be drawn
+        self.lateFrames = 0
+        # frames that finished after their deadline
+
+        self.startCycle = chip.cycleCount
+        self.startTime = time.perf_counter()
+        chip.stats = self
+
+    def add_time(self, part, seconds):
+        """count seconds spent in a part of the run, one of TIMES"""
+        self.times[part] += seconds
+
+    def instruction_counts(self):
+        """return the number of instructions run by handler name, most run
+        first. Instructions that don't decode are counted as invalid"""
+        table = chip8.decode_table()
+        counts = {}
+        for inst, count in enumerate(self.opcodes):
+            if count:
+                name = "invalid" if table[inst] is None else table[inst][2]
+                counts[name] = counts.get(name, 0) + count
+
+        return dict(sorted(counts.items(), key=lambda item: -item[1]))
+
+    def report(self):
+        """return every counter as a dict that can be dumped to JSON"""
+        elapsed = time.perf_counter() - self.startTime
+        cycles = self.chip.cycleCount - self.startCycle
+
+        return {
+            "cycles": cycles,
+            "seconds": elapsed,
+            "clock": {
+                "target": self.chip.clockSpeed,
+                "achieved": cycles / elapsed if elapsed else 0.0,
+            },
+            "instructions": self.instruction_counts(),
+            "idleCycles": self.idleCycles,
+            "draws": {
+                "sprites": self.sprites,
+                "clears": self.clears,
+                "pixels": self.pixels,
+            },
+            "times": dict(self.times),
+            "frames": {
+                "rendered": self.framesRendered,
+                "dropped": self.framesDropped,
+                "late": self.lateFrames,
+            },
+        }
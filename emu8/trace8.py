@@ -0,0 +1,241 @@
+import analyze8
+import chip8
+import headless8
+import jit8
+import argparse
+import hashlib
+import random
+import struct
+import sys
+import time
+
+MAGIC = b"E8TR"
+# first bytes of every trace file
+VERSION = 2
+# bumped whenever the format or anything it replays, like RND, changes
+
+# after the magic: version, rng seed, clock speed and program length, then
+# the program itself
+HEADER = struct.Struct("<BQIH")
+
+# kinds of event. Each event is a varint of the cycles since the last event
+# shifted left two bits with the kind in the bottom two
+TICK = 0
+# the timers counted down
+KEYS = 1
+# the keys changed, followed by the pressed keys as a 16-bit mask
+END = 2
+# the run stopped, followed by the sha256 of the chip's final snapshot
+
+KEY_MASK = struct.Struct("<H")
+
+
+def keys_mask(keys):
+    """return key states as a 16-bit mask with key 0 in the bottom bit"""
+    mask = 0
+    for key, pressed in enumerate(keys):
+        if pressed:
+            mask |= 1 << key
+    return mask
+
+
+def write_varint(out, value):
+    """append a non-negative integer to a bytearray 7 bits at a time, with
+    the top bit of each byte set on all but the last"""
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def snapshot_digest(chip):
+    """return the sha256 of a chip's snapshot, for comparing final states"""
+    return hashlib.sha256(chip.snapshot()).digest()
+
+
+class Recorder:
+    """log everything a run depends on besides its program, so the exact
+    same run can be replayed headless: the seed for RND, the cycle each
+    timer tick happened at and the key states at the start of each frame.
+    The seed is the chip's own if it was given one. The chip only sees
+    keys change between frames, so input that arrives mid-frame is held in
+    pending until the next one. A recorder has to be attached right after
+    the program is loaded."""
+
+    def __init__(self, chip, seed=None):
+        self.chip = chip
+        if seed is None:
+            seed = chip.rngSeed
+        if seed is None:
+            seed = random.randrange(1 << 64)
+        if not 0 <= seed < 1 << 64:
+            raise ValueError(f"trace seeds have to fit in 64 bits: {seed}")
+        self.seed = seed
+        chip.seed(seed)
+
+        # the program is everything loaded after the digit sprites
+        program = bytes(chip.mem[chip8.Chip.PROGRAM_MEM_INDEX :]).rstrip(b"\0")
+        self.header = (
+            MAGIC
+            + HEADER.pack(VERSION, seed, chip.clockSpeed, len(program))
+            + program
+        )
+        self.events = bytearray()
+        # events recorded so far
+        self.lastCycle = chip.cycleCount
+        # cycle count at the last event
+        self.lastKeys = keys_mask(chip.keys)
+        # key states at the last key event
+        self.pending = None
+        # key states from input that can change at any time, copied to the
+        # chip by sync. None if keys only change between frames
+
+        chip.recorder = self
+
+    def add_event(self, kind):
+        """log an event at the chip's current cycle"""
+        cycle = self.chip.cycleCount
+        write_varint(self.events, (cycle - self.lastCycle) << 2 | kind)
+        self.lastCycle = cycle
+
+    def tick(self):
+        """log a timer tick, called by Chip.tick_timers"""
+        self.add_event(TICK)
+
+    def sync(self):
+        """copy any pending key states to the chip and log the keys if
+        they've changed, called at the start of each frame"""
+        if self.pending is not None:
+            self.chip.keys[:] = self.pending
+
+        mask = keys_mask(self.chip.keys)
+        if mask != self.lastKeys:
+            self.add_event(KEYS)
+            self.events += KEY_MASK.pack(mask)
+            self.lastKeys = mask
+
+    def trace(self):
+        """return the trace of the run so far as bytes"""
+        events = bytearray(self.events)
+        write_varint(events, (self.chip.cycleCount - self.lastCycle) << 2 | END)
+        return self.header + bytes(events) + snapshot_digest(self.chip)
+
+    def save(self, path):
+        """write the trace of the run so far to a file"""
+        with open(path, "wb") as out:
+            out.write(self.trace())
+
+
+def read_trace(data):
+    """split a trace into its seed, clock speed, program and a list of
+    (cycles since the last event, kind, value) events. The value is the key
+    mask for key events and the final digest for the end"""
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError("not a trace file")
+    version, seed, clockSpeed, length = HEADER.unpack_from(data, len(MAGIC))
+    if version != VERSION:
+        raise ValueError(f"unsupported trace version: {version}")
+
+    pos = len(MAGIC) + HEADER.size
+    program = data[pos : pos + length]
+    pos += length
+
+    events = []
+    while True:
+        value = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+
+        cycles, kind = value >> 2, value & 3
+        if kind == KEYS:
+            events.append((cycles, kind, KEY_MASK.unpack_from(data, pos)[0]))
+            pos += KEY_MASK.size
+        elif kind == END:
+            events.append((cycles, kind, data[pos : pos + 32]))
+            return seed, clockSpeed, program, events
+        else:
+            events.append((cycles, kind, None))
+
+
+def replay(data, translate=False):
+    """re-run a recorded trace headless at full speed, using the translator
+    if translate is set. Returns the final state of the chip as
+    headless8.run_headless does, along with whether it matches the state
+    the recording ended in and any error the program raised"""
+    seed, clockSpeed, program, events = read_trace(data)
+
+    chip = chip8.Chip(seed)
+    chip.load_program(program)
+    chip.clockSpeed = clockSpeed
+    if translate:
+        jit8.Translator(chip).precompile(analyze8.analyze_chip(chip))
+
+    error = None
+    digest = None
+    start = time.perf_counter()
+    try:
+        for cycles, kind, value in events:
+            if chip.run_cycles(cycles) != cycles:
+                raise Exception(f"Trace diverged at cycle {chip.cycleCount}")
+
+            if kind == TICK:
+                chip.tick_timers()
+            elif kind == KEYS:
+                chip.keys = [bool(value >> key & 1) for key in range(16)]
+            else:
+                digest = value
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        digest = events[-1][2]
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        "cycles": chip.cycleCount,
+        "seconds": elapsed,
+        "ips": chip.cycleCount / elapsed if elapsed else 0.0,
+    }
+    result = headless8.chip_result(chip, stats)
+    result["matches"] = snapshot_digest(chip) == digest
+    result["error"] = error
+    return result
+
+
+def init_argparse():
+    """create an argument parser"""
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s [OPTION] TRACE",
+        description="""Replay a trace recorded with emu8.py --record headless
+            at full speed and print the final state as JSON, checking that it
+            matches the recording.""",
+    )
+    parser.add_argument("trace", metavar="TRACE", help="the trace file to replay")
+    parser.add_argument(
+        "-jt",
+        "--jit",
+        action="store_true",
+        help="compile blocks of instructions to python as they're reached",
+    )
+    parser.add_argument(
+        "-o", "--output", metavar="file", help="write the result to a file instead of stdout"
+    )
+    return parser
+
+
+def main():
+    args = init_argparse().parse_args()
+
+    with open(args.trace, "rb") as trace:
+        result = replay(trace.read(), args.jit)
+
+    headless8.write_result(result, args.output)
+    if not result["matches"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,28 @@
+import chip8
 import curses
 import debug8
 
 
+# characters for a pair of pixels one above the other in half block mode,
+# by the top and bottom pixel as binary digits
+HALF_BLOCKS = {"00": " ", "10": "\u2580", "01": "\u2584", "11": "\u2588"}
+
+
 class Tui:
     """represent the terminal user interface for a chip8 Chip object"""
 
-    def __init__(self, stdscr, chip, compmode):
+    def __init__(self, stdscr, chip, compmode, halfblock=False):
         """inintialize instance data and set curses settings"""
         self.stdscr = stdscr
         self.chip = chip
         self.compmode = compmode  # are we running in fast mode or comprehensive mode
+        self.halfblock = halfblock  # draw two rows of pixels per line of text
+
+        # size of the chip display window, the other windows go around it
+        if self.halfblock:
+            self.chipWinSize = ((chip8.Chip.DISPLAY_Y_MAX + 1) // 2 + 1, 65)
+        else:
+            self.chipWinSize = (33, 129)
 
         curses.initscr()  # intialize screen
         curses.noecho()  # don't write pressed characters to the screen
@@ -37,19 +50,26 @@ class Tui:
 
     def init_chip_win(self):
         """create window to display chip-8 screen contents"""
-        self.chipWin = curses.newwin(33, 129, 0, 0)
+        height, width = self.chipWinSize
+        self.chipWin = curses.newwin(height, width, 0, 0)
 
         # set colors
         curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_GREEN)
         self.chipWinColors = curses.color_pair(1)
+        # half blocks are drawn in the foreground color
+        curses.init_pair(4, curses.COLOR_GREEN, curses.COLOR_BLACK)
+        self.chipWinHalfColors = curses.color_pair(4)
 
-        for i in range(32):
-            self.chipWin.addstr(i, 0, " " * 129)
+        for i in range(height - 1):
+            self.chipWin.addstr(i, 0, " " * width)
         self.chipWin.refresh()
 
+        # rows of the display as they were last drawn to the window
+        self.chipWinRows = [0] * (chip8.Chip.DISPLAY_Y_MAX + 1)
+
     def init_reg_win(self):
         """create window to display register contents and insert labels"""
-        self.regWin = curses.newwin(6, 41, 33, 0)
+        self.regWin = curses.newwin(6, 41, self.chipWinSize[0], 0)
 
         # registers 0 - F
         for row in range(4):
@@ -67,12 +87,14 @@ class Tui:
         self.regWin.addstr(5, 0, istr)
         self.regWin.addstr("   " + dtstr)
         self.regWin.addstr("   " + ststr)
+        self.regShown = None
+        # registers the window last showed
 
         self.regWin.refresh()
 
     def init_mem_win(self):
         """create window to display chip memory contents"""
-        self.memWin = curses.newwin(45, 27, 0, 130)
+        self.memWin = curses.newwin(45, 27, 0, self.chipWinSize[1] + 1)
 
         memlimit = 20
 
@@ -91,12 +113,14 @@ class Tui:
 
         curses.init_pair(5, curses.COLOR_BLACK, curses.COLOR_WHITE)
         # self.memWin.addstr(3, 6 * memlimit, "^", curses.color_pair(5))
+        self.memShown = None
+        # program counter and memory the window last showed
 
         self.memWin.refresh()
 
     def init_key_win(self):
         """create window to display keys pressed on the chip"""
-        self.keyWin = curses.newwin(5, 15, 33, 42)
+        self.keyWin = curses.newwin(5, 15, self.chipWinSize[0], 42)
         offset = 5
 
         # set key coordinates in the window
@@ -131,113 +155,195 @@ class Tui:
         curses.init_pair(3, curses.COLOR_BLACK, curses.COLOR_WHITE)
         self.descHighlightColor = curses.color_pair(3)
 
-        self.descWin = curses.newwin(3, 100, 41, 56)
+        self.descWin = curses.newwin(3, 100, self.chipWinSize[0] + 8, 56)
 
         self.descWin.addstr(0, 0, "invalid instruction")
         self.descWin.addstr(1, 0, "invalid instruction", self.descHighlightColor)
         self.descWin.addstr(2, 0, "invalid instruction", curses.color_pair(0))
+        self.descShown = None
+        # program counter and instructions the window last showed
 
         self.descWin.refresh()
 
     def init_input_win(self):
         """initialize a blank window to accept user input"""
-        self.inputWin = curses.newwin(1, 1, 39, 0)
+        self.inputWin = curses.newwin(1, 1, self.chipWinSize[0] + 6, 0)
         self.inputWin.addstr(0, 0, "")  # add blank sting to set cursor
 
-    def update(self):
-        """alternative method to update all windows"""
+    def prompt(self, text):
+        """show some text on the row of the input window and return the line
+        typed after it"""
+        width = 40
+        win = curses.newwin(1, width, self.chipWinSize[0] + 6, 0)
+        win.addstr(0, 0, text)
+
+        curses.echo()
+        curses.curs_set(1)
+        line = win.getstr(0, len(text), width - len(text) - 1)
+        curses.noecho()
+        curses.curs_set(0)
+
+        win.erase()
+        win.refresh()
+        return line.decode(errors="replace")
+
+    def update(self, frame=None):
+        """alternative method to update all windows. frame is the display
+        rows and mask of dirty rows to draw, by default taken from the chip.
+        The windows are all written to the terminal at once at the end"""
         if self.compmode:
-            self.update_windows_comp()
+            self.update_windows_comp(frame)
         else:
-            self.update_windows_fast()
+            self.update_windows_fast(frame)
+        curses.doupdate()
 
-    def update_windows_fast(self):
+    def update_windows_fast(self, frame=None):
         """update the minimal number of windows (fast mode)"""
-        self.update_chip_win()
+        self.update_chip_win(frame)
         self.update_key_win()
         self.update_input_win()
 
-    def update_windows_comp(self):
+    def update_windows_comp(self, frame=None):
         """update all windows (comprehensive mode)"""
-        self.update_chip_win()
+        self.update_chip_win(frame)
         self.update_reg_win()
         self.update_mem_win()
         self.update_key_win()
         self.update_desc_win()
         self.update_input_win()
 
-    def update_chip_win(self):
-        """update the chip display window to match the chip"""
-
-        # note that the display on the chip is sideways
-        disp = self.chip.disp
-        for x, column in enumerate(disp):
-            for y, val in enumerate(column):
-                if val:
-                    self.chipWin.addstr(y, x * 2, "  ", self.chipWinColors)
+    def update_chip_win(self, frame=None):
+        """update the chip display window to match the chip, or a frame of
+        display rows and dirty row mask, redrawing only the pixels that
+        changed since the last update"""
+        if frame is None:
+            frame = self.chip.disp, self.chip.take_dirty_rows()
+        disp, dirty = frame
+        if not dirty:
+            return
+        if self.halfblock:
+            self.update_chip_win_halfblock(disp, dirty)
+            return
+
+        # each row of the chip display is an integer, one bit per pixel
+        drawn = False
+        for y, row in enumerate(disp):
+            if not (dirty >> y) & 1 or row == self.chipWinRows[y]:
+                continue
+
+            changed = format(row ^ self.chipWinRows[y], "064b")
+            pixels = format(row, "064b")
+            self.chipWinRows[y] = row
+            drawn = True
+
+            # draw each run of changed pixels of the same color at once
+            x = changed.find("1")
+            while x != -1:
+                end = x + 1
+                while end < len(changed) and changed[end] == "1":
+                    if pixels[end] != pixels[x]:
+                        break
+                    end += 1
+
+                if pixels[x] == "1":
+                    color = self.chipWinColors
                 else:
-                    self.chipWin.addstr(y, x * 2, "  ", curses.color_pair(0))
+                    color = curses.color_pair(0)
+                self.chipWin.addstr(y, x * 2, "  " * (end - x), color)
 
-        self.chipWin.refresh()
+                x = changed.find("1", end)
+
+        if drawn:
+            self.chipWin.noutrefresh()
+
+    def update_chip_win_halfblock(self, disp, dirty):
+        """redraw each line of the chip display window holding a dirty row
+        as a single string of half blocks"""
+        rows = self.chipWinRows
+
+        drawn = False
+        for line in range(len(disp) // 2):
+            top, bottom = 2 * line, 2 * line + 1
+            if not (dirty >> top) & 3:
+                continue
+            if disp[top] == rows[top] and disp[bottom] == rows[bottom]:
+                continue
+
+            rows[top], rows[bottom] = disp[top], disp[bottom]
+            tops, bottoms = format(rows[top], "064b"), format(rows[bottom], "064b")
+            text = "".join(HALF_BLOCKS[t + b] for t, b in zip(tops, bottoms))
+            self.chipWin.addstr(line, 0, text, self.chipWinHalfColors)
+            drawn = True
+
+        if drawn:
+            self.chipWin.noutrefresh()
 
     def update_reg_win(self):
         """update register window to match contents of chip registers"""
+        chip = self.chip
+        shown = (tuple(chip.regs), chip.regI, chip.dt, chip.st)
+        if shown == self.regShown:
+            return
+        self.regShown = shown
 
         # registers 0-15
         for row in range(4):
             for col in range(4):
                 reg = 4 * row + col
-                valstr = Tui.double_hex(self.chip.regs[reg])
+                valstr = debug8.BYTE_HEX[chip.regs[reg]]
                 self.regWin.addstr(row, 10 * col + 3, valstr)
 
         # special purpose registers
         # I
-        valstr = Tui.triple_hex(self.chip.regI)
+        valstr = debug8.ADDR_HEX[chip.regI]
         self.regWin.addstr(5, 3, valstr)
         # DT
-        valstr = Tui.double_hex(self.chip.dt)
+        valstr = debug8.BYTE_HEX[chip.dt]
         self.regWin.addstr(5, 15, valstr)
         # ST
-        valstr = Tui.double_hex(self.chip.st)
+        valstr = debug8.BYTE_HEX[chip.st]
         self.regWin.addstr(5, 26, valstr)
 
-        self.regWin.refresh()
+        self.regWin.noutrefresh()
 
     def update_mem_win(self):
         """update memory window to match contents of chip memory"""
 
         memlimit = 20  # this should be instance data probably
         pc = self.chip.pc
-        mem = self.chip.mem
+        mem = self.chip.memView
+
+        # nothing to draw unless the program counter or the memory around it
+        # has changed
+        shown = (pc, mem[max(0, pc - memlimit) : pc + memlimit + 2].tobytes())
+        if shown == self.memShown:
+            return
+        self.memShown = shown
 
         self.memWin.erase()
 
         y = 0
         for addr in range(pc - memlimit, pc + memlimit + 1):
-
-            if addr == pc:
-                color = 5
-            else:
-                color = 0
-
-            # memory address column
-            self.memWin.addstr(y, 0, Tui.triple_hex(addr), curses.color_pair(color))
-            # memory value column
-            self.memWin.addstr(
-                y, 6, Tui.double_hex(mem[addr]), curses.color_pair(color)
-            )
-            # assembly instruction column
+            addrstr = Tui.triple_hex(addr)
+            valstr = debug8.BYTE_HEX[mem[addr]]
             if (addr - (pc % 2)) % 2 == 0:
                 inst = (mem[addr] << 8) + mem[addr + 1]
-                self.memWin.addstr(
-                    y, 12, debug8.inst_to_asm(inst), curses.color_pair(color)
-                )
+                aststr = debug8.asm_text(inst)
+            else:
+                aststr = ""
+
+            if addr == pc:
+                # memory address, value and assembly instruction columns
+                color = curses.color_pair(5)
+                self.memWin.addstr(y, 0, addrstr, color)
+                self.memWin.addstr(y, 6, valstr, color)
+                self.memWin.addstr(y, 12, aststr or " " * 15, color)
             else:
-                self.memWin.addstr(y, 12, "               ", curses.color_pair(color))
+                self.memWin.addstr(y, 0, f"{addrstr:<6}{valstr:<6}{aststr}")
 
             y += 1
 
-        self.memWin.refresh()
+        self.memWin.noutrefresh()
 
     def update_key_win(self):
         """update key window to match contents of keys on chip"""
@@ -249,7 +355,7 @@ class Tui:
             else:
                 self.keyWin.addstr(y, x, hex(key)[2], curses.color_pair(0))
 
-        self.keyWin.refresh()
+        self.keyWin.noutrefresh()
 
     def update_desc_win(self):
         """update description window with previous, current, and next instruction descriptions"""
@@ -257,43 +363,37 @@ class Tui:
         # account for jumps
 
         pc = self.chip.pc
-        mem = self.chip.mem
-
-        self.descWin.erase()
+        mem = self.chip.memView
 
         prevInst = (mem[pc - 2] << 8) + mem[pc - 1]
         currInst = (mem[pc] << 8) + mem[pc + 1]
         nextInst = (mem[pc + 2] << 8) + mem[pc + 3]
 
-        prevDesc = debug8.inst_to_asmdesc(prevInst)
-        currDesc = debug8.inst_to_asmdesc(currInst)
-        nextDesc = debug8.inst_to_asmdesc(nextInst)
+        shown = (prevInst, currInst, nextInst)
+        if shown == self.descShown:
+            return
+        self.descShown = shown
+
+        self.descWin.erase()
+
+        prevDesc = debug8.desc_text(prevInst)
+        currDesc = debug8.desc_text(currInst)
+        nextDesc = debug8.desc_text(nextInst)
 
         self.descWin.addstr(0, 0, prevDesc)
         self.descWin.addstr(1, 0, currDesc, self.descHighlightColor)
         self.descWin.addstr(2, 0, nextDesc, curses.color_pair(0))
 
-        self.descWin.refresh()
+        self.descWin.noutrefresh()
 
     def update_input_win(self):
         """update input window to set cursor to receive input"""
         self.inputWin.addstr(0, 0, "")
 
-    @staticmethod
-    def double_hex(n):
-        """return a two digit hex representation of an integer"""
-        h = hex(n)
-        if len(h) == 3:
-            h = h[:2] + "0" + h[2]
-        return h
-
-    @staticmethod
-    def triple_hex(n):
-        """return a three digit hex representation of an integer"""
-        h = Tui.double_hex(n)
-        if len(h) == 4:
-            h = h[:2] + "0" + h[2:]
-        return h
+    # hex labels come from debug8, so the disassembler can use them without
+    # curses
+    double_hex = staticmethod(debug8.double_hex)
+    triple_hex = staticmethod(debug8.triple_hex)
 
 
 def main(stdscr):
@@ -0,0 +1,483 @@
+import chip8
+import numpy as np
+import random
+import time
+
+Chip = chip8.Chip
+
+# index into chip8.OPCODES for every instruction, -1 for ones that don't
+# exist, so a whole batch of instructions can be decoded with one lookup
+OP_NAMES = tuple(name for _, _, name, _ in chip8.OPCODES)
+OP_INDEX = np.array(
+    [-1 if op is None else OP_NAMES.index(op[2]) for op in chip8.decode_table()],
+    dtype=np.int8,
+)
+
+
+class ChipArray:
+    """many chip8 machines stepped in lockstep. The state of every machine
+    is held in NumPy arrays with one row per machine, and each step
+    decodes the current instruction of every machine at once then runs
+    each kind of instruction as a masked operation over the machines
+    that have it.
+
+    Machines behave the same as chip8.Chip, except that where a Chip would
+    raise an exception (a bad instruction or an out of range address) the
+    machine is marked as faulted and stops. Each machine draws RND from its
+    own generator the way a Chip does, so with the same seed they get the
+    same numbers."""
+
+    def __init__(self, n, seed=None):
+        self.n = n
+        # number of machines
+
+        self.mem = np.zeros((n, Chip.RAM_SIZE), np.uint8)
+        self.regs = np.zeros((n, 16), np.uint8)
+        self.regI = np.zeros(n, np.int64)
+        self.pc = np.full(n, Chip.PROGRAM_MEM_INDEX, np.int64)
+        self.stack = np.zeros((n, 16), np.int64)
+        self.sp = np.zeros(n, np.int64)
+        self.dt = np.zeros(n, np.int64)
+        self.st = np.zeros(n, np.int64)
+        self.disp = np.zeros((n, Chip.DISPLAY_Y_MAX + 1), np.uint64)
+        # one 64-bit integer per display row, as in chip8.Chip
+        self.keys = np.zeros((n, 16), bool)
+        self.cycleCount = np.zeros(n, np.int64)
+        self.stepCount = 0
+        # steps the array has run, which places the 60Hz frames as a
+        # Chip's cycle count does. Machines that stop don't count cycles,
+        # so this carries on for them
+
+        self.halted = np.zeros(n, bool)
+        # machines that have reached an EXIT instruction
+        self.faulted = np.zeros(n, bool)
+        # machines that hit an instruction a Chip would raise on
+
+        self.clockSpeed = Chip.CLOCK_SPEED
+        self.rngSeed = seed
+        # seed the generators of newly loaded machines start from, as on a
+        # Chip
+        self.rngs = [random.Random(seed) for _ in range(n)]
+        # generator RND draws from for each machine
+        self.randomBytes = [b""] * n
+        # bytes drawn from each machine's generator in bulk, as on a Chip
+        self.randomPos = [0] * n
+        # index of each machine's next random byte
+
+        # the digit sprites live at the same place as on a Chip
+        digits = Chip().dump_mem(Chip.DIGIT_MEM_INDEX, Chip.DIGIT_MEM_INDEX + 80)
+        self.mem[:, Chip.DIGIT_MEM_INDEX : Chip.DIGIT_MEM_INDEX + 80] = np.frombuffer(
+            digits, np.uint8
+        )
+
+    @classmethod
+    def from_chips(cls, chips, seed=None):
+        """create an array of machines with the same state as some chips,
+        their random number generators included. seed is used for programs
+        loaded later"""
+        array = cls(len(chips), seed)
+        for i, chip in enumerate(chips):
+            array.load_chip(i, chip)
+        array.clockSpeed = chips[0].clockSpeed if chips else Chip.CLOCK_SPEED
+        array.stepCount = chips[0].cycleCount if chips else 0
+        return array
+
+    def load_program(self, vals, machines=slice(None)):
+        """reset machines (all of them by default) and load a program into
+        their memory"""
+        program = np.frombuffer(bytes(vals), np.uint8)
+        end = Chip.PROGRAM_MEM_INDEX + len(program)
+        if end > Chip.RAM_SIZE:
+            raise IndexError(f"{len(program)} bytes don't fit in program memory")
+
+        self.load_chip(machines, Chip(self.rngSeed))
+        self.mem[machines, Chip.PROGRAM_MEM_INDEX : end] = program
+
+    def load_chip(self, machines, chip):
+        """set the state of one or more machines from a chip"""
+        fields = chip8.SNAPSHOT.unpack(chip.snapshot())
+
+        self.mem[machines] = np.frombuffer(fields[0], np.uint8)
+        self.regs[machines] = np.frombuffer(fields[1], np.uint8)
+        self.disp[machines] = np.array(fields[2:34], np.uint64)
+        self.keys[machines] = np.frombuffer(fields[34], np.uint8).astype(bool)
+        self.stack[machines] = fields[35:51]
+        self.regI[machines] = fields[51]
+        self.pc[machines] = fields[52]
+        self.sp[machines] = fields[53]
+        self.dt[machines] = fields[54]
+        self.st[machines] = fields[55]
+        self.cycleCount[machines] = fields[56]
+        self.halted[machines] = False
+        self.faulted[machines] = False
+
+        for i in np.arange(self.n)[machines].reshape(-1):
+            self.rngs[i] = random.Random()
+            self.rngs[i].setstate(chip.rng.getstate())
+            self.randomBytes[i] = chip.randomBytes
+            self.randomPos[i] = chip.randomPos
+
+    def to_chip(self, i):
+        """return a chip with the same state as machine i"""
+        chip = Chip(self.rngSeed)
+        chip.clockSpeed = self.clockSpeed
+        chip.rng.setstate(self.rngs[i].getstate())
+        chip.randomBytes = self.randomBytes[i]
+        chip.randomPos = self.randomPos[i]
+        chip.restore(
+            chip8.SNAPSHOT.pack(
+                self.mem[i].tobytes(),
+                self.regs[i].tobytes(),
+                *(int(row) for row in self.disp[i]),
+                self.keys[i].astype(np.uint8).tobytes(),
+                *(int(addr) for addr in self.stack[i]),
+                int(self.regI[i]),
+                int(self.pc[i]),
+                int(self.sp[i]),
+                int(self.dt[i]),
+                int(self.st[i]),
+                int(self.cycleCount[i]),
+            )
+        )
+        return chip
+
+    def running(self):
+        """return the indices of machines that haven't exited or faulted"""
+        return np.flatnonzero(~(self.halted | self.faulted))
+
+    def run_fast(self, max_cycles=None):
+        """run every machine as fast as possible until they have all exited
+        or max_cycles steps have run, with the same 60Hz frames as
+        Chip.run_fast. Returns the total instructions run, the time taken and
+        the instructions per second achieved."""
+        start = time.perf_counter()
+        startCount = int(self.cycleCount.sum())
+
+        steps = 0
+        while self.running().size:
+            end = self.frame_start(self.current_frame() + 1)
+            n = end - self.stepCount
+            if max_cycles is not None:
+                n = min(n, max_cycles - steps)
+                if n <= 0:
+                    break
+
+            self.run_cycles(n)
+            steps += n
+
+            # only machines that ran the whole frame count down their timers
+            if self.stepCount == end:
+                self.tick_timers()
+
+        elapsed = time.perf_counter() - start
+        cycles = int(self.cycleCount.sum()) - startCount
+        return {
+            "cycles": cycles,
+            "seconds": elapsed,
+            "ips": cycles / elapsed if elapsed else 0.0,
+        }
+
+    # frames are split up the same way as on a Chip
+    frame_start = Chip.frame_start
+    frame_cycles = Chip.frame_cycles
+
+    def current_frame(self):
+        """return the 60Hz frame the step count is in"""
+        return self.stepCount * Chip.TIMER_SPEED // self.clockSpeed
+
+    def run_frame(self, n):
+        """run n steps then count the timers down once"""
+        self.run_cycles(n)
+        self.tick_timers()
+
+    def run_cycles(self, n):
+        """run n steps without touching the timers"""
+        for _ in range(n):
+            if not self.step():
+                break
+            self.stepCount += 1
+
+    def tick_timers(self):
+        """count the timers of every running machine down by one"""
+        machines = self.running()
+        self.dt[machines] = np.maximum(self.dt[machines] - 1, 0)
+        self.st[machines] = np.maximum(self.st[machines] - 1, 0)
+
+    def step(self):
+        """run the current instruction on every running machine. Returns the
+        number of machines that ran an instruction"""
+        m = self.running()
+        if not m.size:
+            return 0
+
+        pc = self.pc[m]
+        ok = pc < Chip.RAM_SIZE - 1
+        if not ok.all():
+            self.faulted[m[~ok]] = True
+            m, pc = m[ok], pc[ok]
+
+        inst = (self.mem[m, pc].astype(np.int64) << 8) | self.mem[m, pc + 1]
+
+        # machines at EXIT stop without running anything
+        ex = inst == Chip.EXIT
+        if ex.any():
+            self.halted[m[ex]] = True
+            m, pc, inst = m[~ex], pc[~ex], inst[~ex]
+
+        ops = OP_INDEX[inst]
+        bad = ops < 0
+        if bad.any():
+            self.faulted[m[bad]] = True
+            m, pc, inst, ops = m[~bad], pc[~bad], inst[~bad], ops[~bad]
+
+        for op in np.unique(ops):
+            sel = ops == op
+            handler = getattr(self, "_" + OP_NAMES[op])
+            handler(m[sel], inst[sel], pc[sel])
+
+        # instructions that faulted part way through don't count
+        ran = m[~self.faulted[m]]
+        self.cycleCount[ran] += 1
+        return ran.size
+
+    def fault(self, m, ok):
+        """mark the machines in m where ok is false as faulted and return
+        the ones that are still fine"""
+        self.faulted[m[~ok]] = True
+        return m[ok]
+
+    def skip_if(self, m, pc, cond):
+        """move to the next instruction, skipping one where cond is true"""
+        self.pc[m] = pc + np.where(cond, 4, 2)
+
+    # instruction handlers, one for each name in chip8.OPCODES. Each takes
+    # the machines running that instruction, the instructions, and the
+    # program counters, and matches the order Chip reads and writes
+    # registers in so that VF comes out the same when x or y is F
+
+    def _CLS(self, m, inst, pc):
+        self.disp[m] = 0
+        self.pc[m] = pc + 2
+
+    def _RET(self, m, inst, pc):
+        sp = self.sp[m]
+        ok = sp >= -16  # python lists allow negative indices
+        m, sp = self.fault(m, ok), sp[ok]
+        self.pc[m] = self.stack[m, sp % 16] + 2
+        self.sp[m] = sp - 1
+
+    def _JP(self, m, inst, pc):
+        self.pc[m] = inst & 0x0FFF
+
+    def _CALL(self, m, inst, pc):
+        sp = self.sp[m] + 1
+        ok = (sp >= -16) & (sp < 16)
+        m, inst, pc, sp = self.fault(m, ok), inst[ok], pc[ok], sp[ok]
+        self.sp[m] = sp
+        self.stack[m, sp % 16] = pc
+        self.pc[m] = inst & 0x0FFF
+
+    def _SEval(self, m, inst, pc):
+        self.skip_if(m, pc, self.regs[m, (inst >> 8) & 0xF] == (inst & 0xFF))
+
+    def _SNEval(self, m, inst, pc):
+        self.skip_if(m, pc, self.regs[m, (inst >> 8) & 0xF] != (inst & 0xFF))
+
+    def _SEreg(self, m, inst, pc):
+        x, y = (inst >> 8) & 0xF, (inst >> 4) & 0xF
+        self.skip_if(m, pc, self.regs[m, x] == self.regs[m, y])
+
+    def _SNEreg(self, m, inst, pc):
+        x, y = (inst >> 8) & 0xF, (inst >> 4) & 0xF
+        self.skip_if(m, pc, self.regs[m, x] != self.regs[m, y])
+
+    def _LDval(self, m, inst, pc):
+        self.regs[m, (inst >> 8) & 0xF] = inst & 0xFF
+        self.pc[m] = pc + 2
+
+    def _ADDval(self, m, inst, pc):
+        x = (inst >> 8) & 0xF
+        self.regs[m, x] = (self.regs[m, x] + (inst & 0xFF)) & 255
+        self.pc[m] = pc + 2
+
+    def _LDreg(self, m, inst, pc):
+        self.regs[m, (inst >> 8) & 0xF] = self.regs[m, (inst >> 4) & 0xF]
+        self.pc[m] = pc + 2
+
+    def _OR(self, m, inst, pc):
+        x, y = (inst >> 8) & 0xF, (inst >> 4) & 0xF
+        self.regs[m, x] = self.regs[m, x] | self.regs[m, y]
+        self.pc[m] = pc + 2
+
+    def _AND(self, m, inst, pc):
+        x, y = (inst >> 8) & 0xF, (inst >> 4) & 0xF
+        self.regs[m, x] = self.regs[m, x] & self.regs[m, y]
+        self.pc[m] = pc + 2
+
+    def _XOR(self, m, inst, pc):
+        x, y = (inst >> 8) & 0xF, (inst >> 4) & 0xF
+        self.regs[m, x] = self.regs[m, x] ^ self.regs[m, y]
+        self.pc[m] = pc + 2
+
+    def _ADDreg(self, m, inst, pc):
+        x, y = (inst >> 8) & 0xF, (inst >> 4) & 0xF
+        total = self.regs[m, x].astype(np.int64) + self.regs[m, y]
+        self.regs[m, x] = total & 255
+        self.regs[m, 15] = total > 255
+        self.pc[m] = pc + 2
+
+    def _SUB(self, m, inst, pc):
+        x, y = (inst >> 8) & 0xF, (inst >> 4) & 0xF
+        self.regs[m, 15] = self.regs[m, x] > self.regs[m, y]
+        diff = self.regs[m, x].astype(np.int64) - self.regs[m, y]
+        self.regs[m, x] = diff & 255
+        self.pc[m] = pc + 2
+
+    def _SHR(self, m, inst, pc):
+        x = (inst >> 8) & 0xF
+        self.regs[m, 15] = self.regs[m, x] % 2
+        self.regs[m, x] = self.regs[m, x] // 2
+        self.pc[m] = pc + 2
+
+    def _SUBN(self, m, inst, pc):
+        x, y = (inst >> 8) & 0xF, (inst >> 4) & 0xF
+        self.regs[m, 15] = self.regs[m, y] > self.regs[m, x]
+        diff = self.regs[m, y].astype(np.int64) - self.regs[m, x]
+        self.regs[m, x] = diff & 255
+        self.pc[m] = pc + 2
+
+    def _SHL(self, m, inst, pc):
+        x = (inst >> 8) & 0xF
+        self.regs[m, 15] = self.regs[m, x] > 127
+        self.regs[m, x] = (self.regs[m, x].astype(np.int64) * 2) & 255
+        self.pc[m] = pc + 2
+
+    def _LDI(self, m, inst, pc):
+        self.regI[m] = inst & 0x0FFF
+        self.pc[m] = pc + 2
+
+    def _JP0(self, m, inst, pc):
+        self.pc[m] = (inst & 0x0FFF) + self.regs[m, 0]
+
+    def random_byte(self, i):
+        """return the next random byte for machine i, as Chip.RND draws
+        them"""
+        pos = self.randomPos[i]
+        if pos == len(self.randomBytes[i]):
+            self.randomBytes[i] = self.rngs[i].randbytes(Chip.RANDOM_BATCH)
+            pos = 0
+        self.randomPos[i] = pos + 1
+        return self.randomBytes[i][pos]
+
+    def _RND(self, m, inst, pc):
+        r = np.array([self.random_byte(i) for i in m], np.int64)
+        self.regs[m, (inst >> 8) & 0xF] = r & inst & 0xFF
+        self.pc[m] = pc + 2
+
+    def _DRW(self, m, inst, pc):
+        n = inst & 0xF
+        index = self.regI[m]
+        ok = index + n <= Chip.RAM_SIZE
+        m, inst, pc, n, index = self.fault(m, ok), inst[ok], pc[ok], n[ok], index[ok]
+
+        x = self.regs[m, (inst >> 8) & 0xF].astype(np.int64) % (Chip.DISPLAY_X_MAX + 1)
+        y = self.regs[m, (inst >> 4) & 0xF].astype(np.int64)
+
+        # where each byte sits in its row, as in Chip.DRW. Bytes with a
+        # negative shift wrap around the right edge
+        shift = Chip.DISPLAY_X_MAX - 7 - x
+        left = np.maximum(shift, 0).astype(np.uint64)
+        right = np.maximum(-shift, 0).astype(np.uint64)
+        wrap = np.where(shift < 0, Chip.DISPLAY_X_MAX + 1 + shift, 0).astype(np.uint64)
+
+        ow = np.zeros(m.size, bool)
+        for i in range(int(n.max(initial=0))):
+            rows = i < n
+            mm = m[rows]
+            b = self.mem[mm, index[rows] + i].astype(np.uint64)
+            sprite = np.where(
+                shift[rows] >= 0,
+                b << left[rows],
+                (b >> right[rows]) | (b << wrap[rows]),
+            )
+
+            row = (y[rows] + i) % (Chip.DISPLAY_Y_MAX + 1)
+            ow[rows] |= (self.disp[mm, row] & sprite) != 0
+            self.disp[mm, row] ^= sprite
+
+        self.regs[m, 15] = ow
+        self.pc[m] = pc + 2
+
+    def _SKP(self, m, inst, pc):
+        key = self.regs[m, (inst >> 8) & 0xF]
+        ok = key < 16
+        m, pc, key = self.fault(m, ok), pc[ok], key[ok]
+        self.skip_if(m, pc, self.keys[m, key])
+
+    def _SKNP(self, m, inst, pc):
+        key = self.regs[m, (inst >> 8) & 0xF]
+        ok = key < 16
+        m, pc, key = self.fault(m, ok), pc[ok], key[ok]
+        self.skip_if(m, pc, ~self.keys[m, key])
+
+    def _LDregdt(self, m, inst, pc):
+        self.regs[m, (inst >> 8) & 0xF] = self.dt[m]
+        self.pc[m] = pc + 2
+
+    def _LDkey(self, m, inst, pc):
+        # machines with no key pressed run this again next step
+        keys = self.keys[m]
+        pressed = keys.any(axis=1)
+        m, inst, pc, keys = m[pressed], inst[pressed], pc[pressed], keys[pressed]
+        self.regs[m, (inst >> 8) & 0xF] = keys.argmax(axis=1)
+        self.pc[m] = pc + 2
+
+    def _LDdt(self, m, inst, pc):
+        self.dt[m] = self.regs[m, (inst >> 8) & 0xF]
+        self.pc[m] = pc + 2
+
+    def _LDst(self, m, inst, pc):
+        self.st[m] = self.regs[m, (inst >> 8) & 0xF]
+        self.pc[m] = pc + 2
+
+    def _ADDi(self, m, inst, pc):
+        self.regI[m] = (self.regI[m] + self.regs[m, (inst >> 8) & 0xF]) & 0x0FFF
+        self.pc[m] = pc + 2
+
+    def _LDdigit(self, m, inst, pc):
+        val = self.regs[m, (inst >> 8) & 0xF].astype(np.int64)
+        self.regI[m] = Chip.DIGIT_MEM_INDEX + 5 * val
+        self.pc[m] = pc + 2
+
+    def _LDbcd(self, m, inst, pc):
+        index = self.regI[m]
+        ok = index + 2 < Chip.RAM_SIZE
+        m, inst, pc, index = self.fault(m, ok), inst[ok], pc[ok], index[ok]
+
+        val = self.regs[m, (inst >> 8) & 0xF]
+        self.mem[m, index] = val // 100
+        self.mem[m, index + 1] = (val // 10) % 10
+        self.mem[m, index + 2] = val % 10
+        self.pc[m] = pc + 2
+
+    def _LDmemreg(self, m, inst, pc):
+        x = (inst >> 8) & 0xF
+        index = self.regI[m]
+        ok = index + x < Chip.RAM_SIZE
+        m, pc, x, index = self.fault(m, ok), pc[ok], x[ok], index[ok]
+
+        for r in range(16):
+            rows = r <= x
+            self.mem[m[rows], index[rows] + r] = self.regs[m[rows], r]
+        self.pc[m] = pc + 2
+
+    def _LDregmem(self, m, inst, pc):
+        x = (inst >> 8) & 0xF
+        index = self.regI[m]
+        ok = index + x < Chip.RAM_SIZE
+        m, pc, x, index = self.fault(m, ok), pc[ok], x[ok], index[ok]
+
+        for r in range(16):
+            rows = r <= x
+            self.regs[m[rows], r] = self.mem[m[rows], index[rows] + r]
+        self.pc[m] = pc + 2
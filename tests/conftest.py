@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the emulator modules import each other as scripts, so they need their own
+# directory on the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "emu8"))
@@ -1,5 +1,596 @@
+import os
+import pytest
+import subprocess
+import sys
+
 from emu8 import __version__
+from emu8 import chip8
 
 
 def test_version():
     assert __version__ == '0.1.0'
+
+
+def test_decode_table():
+    table = chip8.decode_table()
+    assert table[0x00E0][2] == "CLS"
+    assert table[0x8AB4][1:] == ((0xA, 0xB), "ADDreg", "xy")
+    assert table[0xD125][1] == (1, 2, 5)
+    assert table[0x5001] is None
+    assert table[0xE000] is None
+
+
+def test_bad_instruction():
+    chip = chip8.Chip()
+    with pytest.raises(Exception, match="Bad instruction"):
+        chip.execute(0xF0FF)
+
+
+def test_run_fast_timers():
+    chip = chip8.Chip()
+    # load 60 into DT then loop forever
+    chip.load_program((0x60, 0x3C, 0xF0, 0x15, 0x12, 0x04))
+    stats = chip.run_fast(2 + chip.clockSpeed // 2)
+    assert stats["cycles"] == 2 + chip.clockSpeed // 2
+    assert chip.dt == 30
+
+
+def test_run_fast_in_chunks():
+    # load 60 into DT then loop forever
+    program = (0x60, 0x3C, 0xF0, 0x15, 0x12, 0x04)
+    whole = chip8.Chip()
+    whole.load_program(program)
+    whole.run_fast(10000)
+    assert whole.dt == 0
+
+    # runs split anywhere count the timers down on the same cycles
+    for size in (5, 7, 13):
+        chip = chip8.Chip()
+        chip.load_program(program)
+        for _ in range(10000 // size):
+            chip.run_fast(size)
+        chip.run_fast(10000 % size)
+        assert chip.snapshot() == whole.snapshot()
+
+
+def test_idle_loops_skip_exactly():
+    # wait 5 frames on DT, set v1 then wait for a key
+    program = bytes.fromhex("6005 f015 f007 3000 1204 6101 f20a")
+    chip = chip8.Chip()
+    chip.load_program(program)
+    assert chip.run_fast(30)["cycles"] == 30
+    assert (chip.pc, chip.regs[0], chip.dt) == (0x206, 2, 2)
+
+    chip.load_program(program)
+    assert chip.run_fast(100000)["cycles"] == 100000
+    assert (chip.pc, chip.regs[1], chip.dt) == (0x20C, 1, 0)
+
+    # set both timers then wait for a key, which skips whole frames while
+    # counting the timers down on the cycles step does
+    program = bytes.fromhex("60ff f015 f018 f10a")
+    skipped, stepped = chip8.Chip(), chip8.Chip()
+    skipped.load_program(program)
+    stepped.load_program(program)
+    skipped.run_fast(1000)
+    for _ in range(1000):
+        stepped.step()
+    assert skipped.snapshot() == stepped.snapshot()
+    assert skipped.dt == 255 - 1000 * 60 // skipped.clockSpeed
+
+
+def test_frame_cycles():
+    chip = chip8.Chip()
+    sizes = [chip.frame_cycles(frame) for frame in range(chip.TIMER_SPEED)]
+    assert sum(sizes) == chip.clockSpeed
+    assert set(sizes) == {8, 9}
+
+
+def test_draw_wraps_and_collides():
+    chip = chip8.Chip()
+    chip.regs[0], chip.regs[1] = 60, 31
+    chip.regI = chip.PROGRAM_MEM_INDEX
+    chip.load_mem(chip.regI, (0xFF, 0x81))
+
+    chip.DRW(0, 1, 2)
+    assert chip.regs[15] == 0
+    assert chip.disp[31] == 0xF000000000000000 | 0xF
+    assert chip.get_pixel(60, 0) and chip.get_pixel(3, 0)
+    assert not chip.get_pixel(63, 0)
+
+    chip.DRW(0, 1, 2)
+    assert chip.regs[15] == 1
+    assert chip.disp == [0] * 32
+
+
+def test_dirty_rows():
+    chip = chip8.Chip()
+    assert chip.take_dirty_rows() == chip.ALL_ROWS
+    assert chip.take_dirty_rows() == 0
+
+    # 3 rows from y = 30 wrap around to row 0
+    chip.regs[0], chip.regs[1] = 10, 62
+    chip.DRW(0, 1, 3)
+    assert chip.take_dirty_rows() == (1 << 30) | (1 << 31) | 1
+
+    chip.CLS()
+    assert chip.take_dirty_rows() == chip.ALL_ROWS
+
+
+def test_frame_buffer():
+    import sched8
+
+    chip = chip8.Chip()
+    framebuffer = sched8.FrameBuffer()
+    framebuffer.publish(chip)
+    assert framebuffer.take() == ([0] * 32, chip.ALL_ROWS)
+    assert framebuffer.take() is None
+
+    # the newest of two frames is shown with the rows changed by both
+    chip.disp[3] = 1
+    chip.dirtyRows = 1 << 3
+    framebuffer.publish(chip)
+    chip.disp[5] = 1
+    chip.dirtyRows = 1 << 5
+    framebuffer.publish(chip)
+    rows, dirty = framebuffer.take()
+    assert rows[3] == rows[5] == 1 and dirty == (1 << 3) | (1 << 5)
+    assert framebuffer.dropped() == 1
+
+
+def test_keyboard_release():
+    import keys8
+
+    chip = chip8.Chip()
+    keyboard = keys8.Keyboard(chip)
+
+    # a single press is held until the repeat delay runs out
+    keyboard.feed(b"5", 0.0)
+    assert chip.keys[5]
+    assert keyboard.expire(0.5) == keyboard.REPEAT_DELAY
+
+    # repeats only hold a key for the repeat gap, and keys are separate
+    keyboard.feed(b"5a\x1b[A", 0.5)
+    keyboard.expire(0.5 + keyboard.REPEAT_GAP)
+    assert not chip.keys[5] and chip.keys[10]
+    assert [event[1:] for event in keyboard.events] == [
+        (5, True),
+        (10, True),
+        (5, False),
+    ]
+
+    # keys on either side of an escape sequence still count
+    chip = chip8.Chip()
+    keyboard = keys8.Keyboard(chip)
+    keyboard.feed(b"1\x1b[A5\x1b[1;5C2\x1bOP3\x1b", 0.0)
+    assert [key for key in range(16) if chip.keys[key]] == [1, 2, 3, 5]
+
+
+def test_load_rom(tmp_path):
+    rom = tmp_path / "test.ch8"
+    rom.write_bytes(bytes((0x60, 0x2A, 0x12, 0x02)))
+
+    chip = chip8.Chip()
+    chip.load_rom(rom)
+    assert chip.get_curr_inst() == 0x602A
+    assert chip.dump_mem(0x200, 0x204) == rom.read_bytes()
+    assert chip.memView[0x202] == 0x12
+
+    with pytest.raises(IndexError):
+        chip.load_program(bytes(chip.RAM_SIZE))
+
+
+def test_snapshot_restore():
+    chip = chip8.Chip()
+    chip.load_program((0x61, 0x05, 0xF1, 0x29, 0xD0, 0x15, 0x22, 0x00))
+    for _ in range(3):
+        chip.step()
+
+    snap = chip.snapshot()
+    chip.step()
+    chip.keys[4] = True
+    assert chip.snapshot() != snap
+
+    chip.restore(snap)
+    assert chip.snapshot() == snap
+    assert chip.pc == 0x206 and chip.sp == 0 and not chip.keys[4]
+    assert chip.get_pixel(0, 5)
+
+
+def test_history_seek():
+    import hist8
+
+    chip = chip8.Chip()
+    chip.load_program((0x60, 0x00, 0x70, 0x01, 0xA3, 0x00, 0xF0, 0x33, 0x12, 0x02))
+    history = hist8.History(chip, interval=16)
+
+    snaps = [chip.snapshot()]
+    for _ in range(200):
+        chip.step()
+        history.record()
+        snaps.append(chip.snapshot())
+
+    assert history.state_at(37) == snaps[37]
+    history.seek(150)
+    assert chip.snapshot() == snaps[150]
+    assert history.back() and chip.snapshot() == snaps[149]
+    assert len(history) == 149
+
+
+def test_headless_keys():
+    import headless8
+
+    keys = headless8.parse_keys("300:7+ # press 7\n400:7-")
+    assert keys == [(300, 7, True), (400, 7, False)]
+    with pytest.raises(ValueError):
+        headless8.parse_keys("1:g+")
+    with pytest.raises(ValueError, match="bad key event"):
+        headless8.parse_keys("0:10+")
+
+    chip = chip8.Chip()
+    # wait for a key, then draw its digit and exit
+    chip.load_program((0xF0, 0x0A, 0xF0, 0x29, 0xD1, 0x15))
+    result = headless8.run_headless(chip, 1000, keys)
+    assert result["exited"]
+    assert result["regs"][0] == 7 and result["regs"][15] == 0
+    assert result["cycles"] == 303
+    assert result["display"][0] == "####" + "." * 60
+
+
+def test_batch(tmp_path):
+    import batch8
+
+    (tmp_path / "loop.ch8").write_bytes(bytes((0x70, 0x01, 0x12, 0x00)))
+    (tmp_path / "bad.ch8").write_bytes(bytes((0x50, 0x01)))
+    (tmp_path / "notes.txt").write_text("not a rom")
+    (tmp_path / "manifest").write_text("loop.ch8  # the loop\nbad.ch8\n")
+
+    roms = batch8.find_roms(tmp_path)
+    assert roms == batch8.find_roms(tmp_path / "manifest")[::-1]
+
+    report = batch8.run_batch(roms, 1000, jobs=2)
+    bad, loop = report["roms"]
+    assert bad["error"] == "Exception: Bad instruction: 20481"
+    assert loop["error"] is None and loop["cycles"] == 1000
+    assert report["total"] == dict(report["total"], roms=2, errors=1, cycles=1000)
+
+
+def test_lockstep_matches_chip():
+    pytest.importorskip("numpy")
+    import vec8
+
+    programs = [
+        # count up in v1 with flags from 8xy4/8xy5/8xyE and draw digits
+        bytes.fromhex("61f0 6233 8124 8f15 8f1e f129 d125 1204"),
+        # store bcd and registers, call and return, wait on DT
+        bytes.fromhex("a300 60fe f033 f255 220c 1200 f015 f107 3100 120e 00ee"),
+        # wait for a key then exit
+        bytes.fromhex("f30a f329"),
+        # bad instruction
+        bytes.fromhex("6001 5001"),
+    ]
+    chips = []
+    for program in programs:
+        chip = chip8.Chip()
+        chip.load_program(program)
+        chips.append(chip)
+    chips[2].keys[9] = True
+
+    array = vec8.ChipArray.from_chips(chips)
+    array.run_fast(500)
+
+    for i, chip in enumerate(chips[:3]):
+        chip.run_fast(500)
+        assert array.to_chip(i).snapshot() == chip.snapshot()
+    assert array.halted[2] and array.faulted[3]
+
+    # seeded machines draw the same random numbers as seeded chips, and
+    # carry on from a chip's generator
+    program = bytes.fromhex("c0ff c1ff 1200")
+    array = vec8.ChipArray(2, seed=7)
+    array.load_program(program)
+    array.run_fast(300)
+    chip = chip8.Chip(7)
+    chip.load_program(program)
+    chip.run_fast(300)
+    assert array.to_chip(1).snapshot() == chip.snapshot()
+
+    array = vec8.ChipArray.from_chips([chip])
+    array.run_fast(300)
+    chip.run_fast(300)
+    assert array.to_chip(0).snapshot() == chip.snapshot()
+
+    # an array run in chunks keeps to the same frames
+    array = vec8.ChipArray(1)
+    array.load_program(programs[1])
+    for _ in range(100):
+        array.run_fast(5)
+    chip = chip8.Chip()
+    chip.load_program(programs[1])
+    chip.run_fast(500)
+    assert array.to_chip(0).snapshot() == chip.snapshot()
+
+
+def test_translator_matches_interpreter():
+    import jit8
+
+    programs = [
+        # flags from every ALU op, I arithmetic and digit sprites
+        bytes.fromhex("61f0 6233 8124 8f15 8126 8217 820e 8f13 f11e f129 d125 1204"),
+        # write over the jump target, then wait on DT and spin
+        bytes.fromhex("6012 610a a20a f155 120a 0000 f015 f107 3100 120e"),
+        # bad instruction after a few cycles
+        bytes.fromhex("6001 7001 5001"),
+    ]
+    for program in programs:
+        chips = []
+        for translate in (False, True):
+            chip = chip8.Chip()
+            chip.load_program(program)
+            if translate:
+                jit8.Translator(chip)
+            try:
+                chip.run_fast(1000)
+            except Exception as e:
+                assert "Bad instruction" in str(e)
+            chips.append(chip)
+        assert chips[0].snapshot() == chips[1].snapshot()
+
+
+def test_stats():
+    import jit8
+    import stats8
+
+    # clear, draw digit 0 twice, then wait on DT and spin
+    program = bytes.fromhex("00e0 6000 f029 d005 d005 6005 f015 f007 3000 120e 1214")
+    for translate in (False, True):
+        chip = chip8.Chip()
+        chip.load_program(program)
+        if translate:
+            jit8.Translator(chip)
+        stats = stats8.Stats(chip)
+        chip.run_fast(1000)
+
+        report = stats.report()
+        assert report["cycles"] == 1000
+        assert sum(report["instructions"].values()) + report["idleCycles"] == 1000
+        assert report["instructions"]["DRW"] == 2
+        assert report["draws"] == {"sprites": 2, "clears": 1, "pixels": 28}
+
+
+def test_profiler():
+    import prof8
+
+    # count v0 up to 3 in a loop, then spin
+    program = bytes.fromhex("6000 7001 3003 1202 1208")
+    chips = []
+    for profile in (False, True):
+        chip = chip8.Chip()
+        chip.load_program(program)
+        if profile:
+            profiler = prof8.Profiler(chip)
+        chip.run_fast(20)
+        chips.append(chip)
+    assert chips[0].snapshot() == chips[1].snapshot()
+
+    spots = {addr: (inst, count) for addr, inst, count, _ in profiler.hot_spots()}
+    assert spots == {
+        0x200: (0x6000, 1),
+        0x202: (0x7001, 3),
+        0x204: (0x3003, 3),
+        0x206: (0x1202, 2),
+        0x208: (0x1208, 11),
+    }
+    assert profiler.handlers()["JP"][0] == 13
+
+    report = profiler.report()
+    assert report.startswith("# 20 instructions")
+    assert "0x208\tJP 0x208 # 11 runs" in report
+    assert "# JP\t13\t" in report
+    listed = profiler.report(limit=2).split("\n\n")[0].splitlines()
+    assert len(listed) == 3
+
+
+def test_bench():
+    import bench8
+
+    results = bench8.run_suite("execute.CALL", rounds=1, min_time=0)
+    assert list(results) == ["execute.CALL+RET"]
+    assert results["execute.CALL+RET"]["ops"] == 1000
+    assert results["execute.CALL+RET"]["rate"] > 0
+
+    names = [name for name, _, _ in bench8.benchmarks()]
+    assert "execute.DRW" in names and "headless.count.jit" in names
+
+    baseline = {"benchmarks": {"a": {"rate": 100.0}, "b": {"rate": 100.0}}}
+    results = {"a": {"rate": 85.0}, "b": {"rate": 95.0}, "c": {"rate": 1.0}}
+    regressions = bench8.compare(results, baseline, threshold=0.1)
+    assert [regression["name"] for regression in regressions] == ["a"]
+
+
+def test_trace_replay():
+    import headless8
+    import jit8
+    import trace8
+
+    # draw random sprites at random places, clearing while key 5 is held
+    program = bytes.fromhex("6205 c0ff c11f f029 d015 e29e 1202 00e0 1202")
+    chip = chip8.Chip()
+    chip.load_program(program)
+    recorder = trace8.Recorder(chip)
+    keys = [(1000, 5, True), (3000, 5, False)]
+    recorded = headless8.run_headless(chip, 5000, keys)
+    trace = recorder.trace()
+
+    for translate in (False, True):
+        result = trace8.replay(trace, translate)
+        assert result["matches"] and result["error"] is None
+        assert result["display"] == recorded["display"]
+        assert result["cycles"] == 5000
+
+    # a different seed draws something else
+    _, _, _, events = trace8.read_trace(trace)
+    assert [event[2] for event in events if event[1] == trace8.KEYS] == [32, 0]
+    other = bytearray(trace)
+    other[len(trace8.MAGIC) + 1] ^= 1
+    assert not trace8.replay(bytes(other))["matches"]
+
+
+def test_seeded_rnd():
+    # fill v0 to vE with random bytes, more than one batch's worth
+    program = bytes.fromhex("c0ff c1ff c2ff c3ff c4ff c5ff c6ff c7ff 1200")
+    runs = []
+    for seed in (1, 1, 2):
+        chip = chip8.Chip(seed)
+        chip.load_program(program)
+        chip.run_fast(chip.RANDOM_BATCH * 2)
+        runs.append(chip.snapshot())
+    assert runs[0] == runs[1] != runs[2]
+
+    chip = chip8.Chip()
+    chip.seed(1)
+    chip.load_program(program)
+    chip.run_fast(chip.RANDOM_BATCH * 2)
+    assert chip.snapshot() == runs[0]
+
+    chip.execute(0xC10F)
+    assert chip.regs[1] <= 0x0F
+
+
+def test_assembler(tmp_path):
+    import asm8
+    import debug8
+
+    # everything inst_to_asm writes assembles back to the same word
+    for inst in range(0, 0x10000, 7):
+        assert asm8.encode(debug8.inst_to_asm(inst)) == inst
+
+    program = asm8.assemble(
+        "# comment\n0x200\tLD v0, 0x0a # ten\nDRW v0, v1, 5\n\n0x206 ERR: 0x80ff\n"
+    )
+    assert program == bytes.fromhex("600a d015 0000 80ff")
+    with pytest.raises(ValueError, match="line 2"):
+        asm8.assemble("CLS\nLD v0, 0x100")
+    with pytest.raises(ValueError, match="line 1"):
+        asm8.assemble("0xzz CLS")
+
+    # numbers without 0x are decimal, leading zeros and all
+    assert asm8.assemble("LD v0, 08\nERR: 010") == bytes.fromhex("6008 000a")
+
+    source = tmp_path / "test.asm"
+    source.write_text("0x200 JP 0x200\n")
+    cache = tmp_path / "cache"
+    assert asm8.assemble_file(str(source), str(cache)) == bytes.fromhex("1200")
+    assert len(list(cache.iterdir())) == 1
+
+    # a changed source is assembled again rather than read from the cache
+    source.write_text("0x200 JP 0x202\n0x202 JP 0x200\n")
+    assert asm8.assemble_file(str(source), str(cache)) == bytes.fromhex("1202 1200")
+    assert len(list(cache.iterdir())) == 2
+
+    # a cache that can't be written to is skipped
+    blocked = tmp_path / "blocked"
+    blocked.write_text("")
+    source.write_text("0x200 CLS\n")
+    assert asm8.assemble_file(str(source), str(blocked / "cache")) == bytes.fromhex(
+        "00e0"
+    )
+
+
+def test_disassembler():
+    import asm8
+    import debug8
+
+    # call a subroutine then loop forever. The subroutine's skip lands on
+    # a sprite, and there's a word between them that's never reached
+    rom = bytes.fromhex("2206 1202 1204 3000 00ee f0f0")
+    assert debug8.find_code(rom) == (
+        {0x200, 0x202, 0x206, 0x208},
+        {0x202},
+        {0x206},
+    )
+
+    lines = list(debug8.disassemble(rom))
+    assert lines[0] == "0x200\tCALL 0x206"
+    assert "# label_202" in lines and "# sub_206" in lines
+    assert "0x204\tERR: 0x1204 # ...#..#. .....#.." in lines
+    assert lines[-1] == "0x20a\tERR: 0xf0f0 # ####.... ####...."
+    assert asm8.assemble("\n".join(lines)) == rom
+
+
+def test_cached_text():
+    import debug8
+    import tui8
+
+    # the memoized text is the same as formatting each instruction afresh
+    for inst in (0x00E0, 0x1234, 0x8AB4, 0xD345, 0xF0F0):
+        assert debug8.asm_text(inst) == debug8.inst_to_asm(inst)
+        assert debug8.desc_text(inst) == debug8.inst_to_asmdesc(inst)
+    assert debug8.asm_text(0x1234) is debug8.asm_text(0x1234)
+
+    assert tui8.Tui.double_hex(5) == "0x05"
+    assert tui8.Tui.double_hex(0x1ab) == "0x1ab"
+    assert tui8.Tui.triple_hex(0x2a) == "0x02a"
+    assert tui8.Tui.triple_hex(0x1000) == "0x1000"
+
+
+def test_analyzer():
+    import analyze8
+    import jit8
+
+    # draw a sprite, call a subroutine that writes over the caller, then
+    # skip to either a JP V0 or an instruction that doesn't decode
+    rom = bytes.fromhex("a214 d012 220c 3000 b300 f0ff a206 f033 00ee 0000 f090")
+    analysis = analyze8.analyze(rom)
+    assert analysis.code == {0x200, 0x202, 0x204, 0x206, 0x208, 0x20C, 0x20E, 0x210}
+    assert analysis.edges[0x210] == (0x206,)
+    assert analysis.blocks == {
+        0x200: (0x206, (0x20C,)),
+        0x20C: (0x212, (0x206,)),
+        0x206: (0x208, (0x208, 0x20A)),
+        0x208: (0x20A, ()),
+        0x20A: (0x20C, ()),
+    }
+    assert analysis.dynamic == {0x208: (0x300, 0x3FF)}
+    assert analysis.bad == {0x20A: 0xF0FF}
+    assert analysis.sprites == {0x214, 0x215}
+    assert analysis.writes == {0x206, 0x207, 0x208}
+    assert analysis.modified == {0x206, 0x208}
+    assert analysis.data(0x200, 0x200 + len(rom)) == [0x212, 0x213, 0x214, 0x215]
+
+    # ADD I, vX can move I anywhere a register can take it
+    assert analyze8.analyze(bytes.fromhex("a300 f01e f055 0000")).writes == set(
+        range(0x300, 0x400)
+    )
+
+    assert analyze8.analyze_program(rom) is analyze8.analyze_program(rom + b"\0")
+
+    chip = chip8.Chip()
+    chip.load_program(rom)
+    translator = jit8.Translator(chip)
+    translator.precompile(analyze8.analyze_chip(chip))
+    assert set(translator.blocks) == {0x200, 0x206, 0x208, 0x20C, 0x210}
+
+    # a second run of the same program reuses the blocks
+    chip.load_program(rom)
+    translator = jit8.Translator(chip)
+    translator.precompile(analyze8.analyze_chip(chip))
+    assert translator.compiled == 0 and len(translator.blocks) == 5
+
+    # only the most recent programs are kept
+    for n in range(analyze8.CACHE_SIZE + 1):
+        analyze8.analyze_program(bytes((0x60, n)))
+    assert len(analyze8._analyses) == analyze8.CACHE_SIZE
+    for n in range(jit8.SHARED_PROGRAMS + 1):
+        chip.load_program(bytes((0x60, n)))
+        jit8.Translator(chip).precompile(analyze8.analyze_chip(chip))
+    assert len(jit8._precompiled) == jit8.SHARED_PROGRAMS
+
+
+def test_headless_tools_skip_curses():
+    # the disassembler, analyzer and headless tools run where curses can't
+    code = "import sys, analyze8, bench8, trace8; print('curses' in sys.modules)"
+    emu8Dir = os.path.join(os.path.dirname(__file__), "..", "emu8")
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=emu8Dir, capture_output=True, text=True
+    )
+    assert result.stdout == "False\n"